@@ -50,12 +50,21 @@ class ApplicationLayer:
 
         return board
 
-    def move(self, a_board_arr=None):
+    def move(self, a_board_arr=None, a_board_probs=None):
+        """
+        Parameters:
+            a_board_arr:    8x8 board array read after the player's move.
+
+            a_board_probs:  8x8xCLASSES square probabilities read after the player's move. When given,
+                            the player's move is decoded as the most likely legal move instead of being
+                            derived from a_board_arr.
+
+        """
         if self.__board.is_game_over():
             sys.stderr.write("Game Over")
             sys.exit(0)
         else:
-            self.__do_move(a_board_arr)
+            self.__do_move(a_board_arr, a_board_probs)
 
     def is_robots_turn(self):
         return self.__turn
@@ -75,8 +84,67 @@ class ApplicationLayer:
         """
         return self.current_engine_move
 
+    def get_move_squares(self, move_details=None):
+        """
+        Parameters:
+            move_details: Details of the robot's move as returned by get_move_details(), defaults
+                          to the last engine move.
+
+        Description:
+            Determines the squares affected by the robot's move: the from and to squares of the
+            move, the rook squares when castling and the captured pawn's square for en passant.
+            The expected contents of these squares after the move are taken from the board and
+            their positions are converted back to the un-oriented board array the perception
+            layer reads, so that only these squares need to be checked.
+
+        Returns:
+            A dictionary mapping (row, col) indexes of the board array to the expected value
+            (1 for White, 0 for Black and -1 for Empty).
+
+        """
+        if move_details is None:
+            move_details = self.current_engine_move
+
+        moves = [self.__flip_move(move_details[0])]
+        if move_details[1] == 2 or move_details[1] == 3:
+            moves.append(self.__flip_move(move_details[2]))
+
+        squares = set()
+        for move in moves:
+            squares.add(chess.parse_square(move[0:2]))
+            squares.add(chess.parse_square(move[2:4]))
+
+        # A position loaded from a board array has no move stack to check for en passant
+        if self.__board.move_stack:
+            last_move = self.__board.pop()
+            if self.__board.is_en_passant(last_move):
+                squares.add(chess.square(chess.square_file(last_move.to_square), chess.square_rank(last_move.from_square)))
+            self.__board.push(last_move)
+
+        raw_index = self.__orient_board(np.arange(64).reshape((8, 8)))
+        expected = {}
+
+        for square in squares:
+            color = self.__board.color_at(square)
+            index = raw_index[7 - chess.square_rank(square), chess.square_file(square)]
+            expected[(index // 8, index % 8)] = -1 if color is None else int(color)
+
+        return expected
+
     # -------------PRIVATE FUNCTIONS----------------#
 
+    def __flip_move(self, move):
+        """
+        Description:
+            Converts a move between the robot's and the board's point of view. The conversion
+            only changes the move when the robot plays Black, and it is its own inverse.
+
+        """
+        if self.__side == chess.BLACK:
+            return chr(8 + ord('a') - ord(move[0]) + 96) + str(8 - int(move[1]) + 1) + chr(
+                8 + ord('a') - ord(move[2]) + 96) + str(8 - int(move[3]) + 1)
+        return move
+
     def __adjust_move_for_side(self, move):
         if VERBOSE:
             print("Initial move:", move)
@@ -88,8 +156,7 @@ class ApplicationLayer:
                 print("Side black, move flipped.")
             if LOGGER:
                 log("Side black, move flipped.")
-            return chr(8 + ord('a') - ord(move[0]) + 96) + str(8 - int(move[1]) + 1) + chr(
-                8 + ord('a') - ord(move[2]) + 96) + str(8 - int(move[3]) + 1)
+            return self.__flip_move(move)
         else:
             if VERBOSE:
                 print("Side white, move used as it is.")
@@ -161,12 +228,12 @@ class ApplicationLayer:
         if LOGGER:
             log("Engine Move details: " + str(self.current_engine_move))
 
-    def __do_move(self, a_board_arr=None):
+    def __do_move(self, a_board_arr=None, a_board_probs=None):
         """
         Description:
             Performs a move. If it is the robot's turn, then the move is provided by the
-            engine, otherwise it is determined from the passed board_arr. The move is
-            pushed onto the board and the board_arr and turn are updated.
+            engine, otherwise it is determined from the passed board_probs or board_arr. The
+            move is pushed onto the board and the board_arr and turn are updated.
 
         """
         if self.__turn:  # Robot's turn
@@ -179,6 +246,15 @@ class ApplicationLayer:
                 print("Engine move: ", next_move)
             if LOGGER:
                 log("Engine move: " + next_move)
+        elif a_board_probs is not None:
+            next_move = self.__decode_player_move(a_board_probs)
+
+            if next_move is None:
+                return
+
+            self.__board.push(next_move)
+            self.__board_arr = self.__get_board_arr(self.__board)
+            self.__turn = True
         else:
             next_move = self.__get_player_move(a_board_arr)
 
@@ -221,7 +297,8 @@ class ApplicationLayer:
     def __orient_board(self, a_board_arr):
         """
         Parameters:
-            a_board_arr: 8x8 numpy array corresponding to a chessboard configuration
+            a_board_arr: 8x8 numpy array corresponding to a chessboard configuration. An 8x8xN
+                         array of per-square values, such as probabilities, is oriented as well.
 
         Description:
             Orients the given board array according to the board's set orientation so that
@@ -236,7 +313,7 @@ class ApplicationLayer:
             sys.stderr.write("Board array cannot be oriented as no orientation has been set.")
 
         if self.__board_orientation == "WT":
-            return np.flip(a_board_arr)
+            return np.flip(a_board_arr, (0, 1))
 
         elif self.__board_orientation == "WR":
             return np.rot90(a_board_arr, 3)
@@ -274,13 +351,13 @@ class ApplicationLayer:
         """
         return len(tuple_list[0])
 
-    def __update_board_arr(self):
+    def __get_board_arr(self, board):
         """
+        Parameters:
+            board: chess.Board whose position should be converted.
+
         Description:
-            When the chess engine updates self.__board after making a move, the update
-            needs to be reflected in the board_array as well. This function reads the
-            updated self.__board and recreates a new board array which is used to overwrite
-            the previous board array.
+            Creates the oriented board array corresponding to the position in the given board.
 
         """
         new_arr = np.zeros((8, 8))
@@ -288,14 +365,25 @@ class ApplicationLayer:
         for i in range(0, 8):
             for j in range(0, 8):
                 # color_at returns 1 for White, 0 for Black and None for Empty
-                color = self.__board.color_at(self.__get_square([i, j]))
+                color = board.color_at(self.__get_square([i, j]))
 
                 if color is None:
                     color = -1
 
                 new_arr[7 - i][j] = color
 
-        self.__board_arr = new_arr
+        return new_arr
+
+    def __update_board_arr(self):
+        """
+        Description:
+            When the chess engine updates self.__board after making a move, the update
+            needs to be reflected in the board_array as well. This function reads the
+            updated self.__board and recreates a new board array which is used to overwrite
+            the previous board array.
+
+        """
+        self.__board_arr = self.__get_board_arr(self.__board)
 
         if VERBOSE:
             print("\nUpdated arr: \n", self.__board_arr)
@@ -558,6 +646,49 @@ class ApplicationLayer:
 
         file.close()
 
+    def __decode_player_move(self, a_board_probs):
+        """
+        Parameters:
+            a_board_probs: 8x8xCLASSES square probabilities from the new board position.
+
+        Description:
+            Scores every legal move by the log-likelihood of the board occupancy it results in
+            under the given square probabilities, and picks the most likely one. The current
+            position is scored as well, so that no move is detected when it is the most likely
+            explanation. Unlike __get_player_move, a few misclassified squares do not make the
+            move undetectable.
+
+        Returns:
+            Returns the most likely move, or None if no move has been made.
+
+        """
+        log_probs = np.log(np.clip(self.__orient_board(a_board_probs), 1e-6, 1.0))
+        channels = np.zeros(3, dtype=int)
+        for index, label in enumerate(LABELS):
+            channels[LABEL_VALUES[label] + 1] = index
+
+        def board_score(board):
+            occupancy = channels[self.__get_board_arr(board).astype(int) + 1]
+            return np.take_along_axis(log_probs, occupancy[..., None], axis=2).sum()
+
+        best_move = None
+        best_score = board_score(self.__board)
+
+        for move in self.__board.legal_moves:
+            self.__board.push(move)
+            score = board_score(self.__board)
+            self.__board.pop()
+
+            if score > best_score:
+                best_move, best_score = move, score
+
+        if VERBOSE:
+            print("Decoded move:", best_move, "Log-likelihood:", best_score)
+        if LOGGER:
+            log("Decoded move:" + str(best_move) + " Log-likelihood:" + str(best_score))
+
+        return best_move
+
     def __get_player_move(self, new_board_arr):
         """
         Parameters:
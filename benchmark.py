@@ -0,0 +1,306 @@
+import argparse
+import glob
+import json
+import multiprocessing
+import os
+import subprocess
+import sys
+import time
+import cv2
+import numpy as np
+from utils import *
+
+
+def load_boards(pattern=SAMPLE_IMAGES):
+    """
+    Description:
+        Locates the chessboard once in every matching image and returns the (image, corners)
+        pairs, so that the benchmarks can time board reads without the detection.
+
+    """
+    from perception import PerceptionLayer
+
+    percept = PerceptionLayer(None, show=False)
+    boards = []
+
+    for image_loc in sorted(glob.glob(pattern)):
+        image = cv2.imread(image_loc)
+
+        try:
+            percept.detect(image)
+        except Exception as e:
+            print("Chessboard not found in", image_loc, "skipping:", e)
+            continue
+
+        boards.append((image, percept.corners))
+
+    return boards
+
+
+def tiers(args):
+    from perception import PerceptionLayer
+
+    boards = load_boards(args.images)
+    reference = None
+
+    print("%-10s %-12s %12s %10s" % ("tier", "backend", "ms / board", "agreement"))
+
+    for tier in ["accurate", "balanced", "fast"]:
+        percept = PerceptionLayer(tier=tier, show=False)
+        image, corners = boards[0]
+        percept.classify_tiles(percept.extract_tiles(image, corners))  # warm-up
+
+        labels = []
+        start = time.perf_counter()
+        for image, corners in boards:
+            board_probs = percept.classify_tiles(percept.extract_tiles(image, corners))
+            labels.append(np.argmax(board_probs, axis=2))
+        ms_per_board = 1000 * (time.perf_counter() - start) / len(boards)
+
+        labels = np.array(labels)
+        if reference is None:
+            reference = labels
+
+        print("%-10s %-12s %12.1f %10.4f" % (tier, MODEL_TIERS[tier], ms_per_board, np.mean(labels == reference)))
+
+
+def detect(args):
+    from concurrent.futures import ThreadPoolExecutor
+    from misc.detector import Detector
+
+    detector = Detector({"pyramid": args.pyramid, "markers": args.markers})
+    images = [cv2.imread(image_loc) for image_loc in sorted(glob.glob(args.images))]
+
+    def run(image):
+        report = []
+        try:
+            detector.detect(image, report)
+            return sum(layer["layer"] > 0 for layer in report)
+        except Exception:
+            return None
+
+    print("%-8s %12s %10s %10s" % ("jobs", "ms / image", "found", "layers"))
+
+    for jobs in sorted(set([1, args.jobs])):
+        start = time.perf_counter()
+        with ThreadPoolExecutor(jobs) as executor:
+            layers = [n for n in executor.map(run, images) if n is not None]
+        ms_per_image = 1000 * (time.perf_counter() - start) / len(images)
+
+        print("%-8d %12.1f %10d %10.2f" % (jobs, ms_per_image, len(layers), np.mean(layers)))
+
+
+def solver(args):
+    from misc.utils import ImageObject
+    from misc.slid import pSLID, SLID, slid_tendency
+    from misc.laps import LAPS
+    from misc.llr import LLR
+    from misc.lattice import RANSAC
+
+    solvers = {"llr": lambda main, points, lines: LLR(main, points, lines, score=True),
+               "ransac": lambda main, points, lines: RANSAC(main, points, score=True)}
+    times = {name: [] for name in solvers}
+    failures = {name: 0 for name in solvers}
+    scores = {name: [] for name in solvers}
+    differences = []
+
+    for image_loc in sorted(glob.glob(args.images)):
+        main = ImageObject(cv2.imread(image_loc))['main']
+        lines = slid_tendency(SLID(main, pSLID(main)))
+        points = LAPS(main, lines)
+        quads = {}
+
+        # Both solvers fit the same LAPS points of the first layer, only LLR uses the lines
+        for name, solve in solvers.items():
+            start = time.perf_counter()
+            try:
+                quad, score = solve(main, points, lines)
+                quads[name] = np.float32(quad)
+                scores[name].append(score)
+            except Exception:
+                failures[name] += 1
+            times[name].append(1000 * (time.perf_counter() - start))
+
+        if len(quads) == 2:
+            dist = np.linalg.norm(quads["llr"][:, None] - quads["ransac"][None], axis=2)
+            differences.append(dist.min(axis=1).max())
+
+    # Both are scored by llr_polyscore against the same clustered LAPS points
+    print("%-8s %12s %12s %10s %14s" % ("solver", "median (ms)", "max (ms)", "failures", "median score"))
+    for name in solvers:
+        print("%-8s %12.1f %12.1f %10d %14.3g" % (name, np.median(times[name]), np.max(times[name]), failures[name],
+                                                 np.median(scores[name]) if scores[name] else float("nan")))
+
+    if len(differences) > 0:
+        print("Corner difference (px): median %.1f, max %.1f" % (np.median(differences), np.max(differences)))
+
+
+def llr(args):
+    from misc.utils import ImageObject
+    from misc.slid import pSLID, SLID, slid_tendency
+    from misc.laps import LAPS
+    from misc.llr import LLR
+
+    times, failures = [], 0
+
+    for image_loc in sorted(glob.glob(args.images)):
+        main = ImageObject(cv2.imread(image_loc))['main']
+        lines = slid_tendency(SLID(main, pSLID(main)))
+        points = LAPS(main, lines)
+
+        start = time.perf_counter()
+        try:
+            LLR(main, points, lines)
+        except Exception:
+            failures += 1
+        times.append(1000 * (time.perf_counter() - start))
+
+    print("%-12s %12s %12s %10s" % ("search", "median (ms)", "max (ms)", "failures"))
+    print("%-12s %12.1f %12.1f %10d" % ("LLR", np.median(times), np.max(times), failures))
+
+
+def parse_budget(budget):
+    """
+    Description:
+        Parses a thread budget such as "opencv=2,tensorflow_intra=2,blas=1". Missing entries
+        are taken from THREAD_BUDGET.
+
+    """
+    parsed = dict(THREAD_BUDGET)
+    for entry in budget.split(","):
+        if not entry.strip():
+            continue
+        name, count = entry.split("=")
+        parsed[name.strip()] = int(count)
+    return parsed
+
+
+def read(args):
+    from threads import configure_threads
+    configure_threads(parse_budget(args.budget), tensorflow=True)
+
+    from inference import load_square_model
+    from perception import PerceptionLayer
+
+    percept = PerceptionLayer(load_square_model(), show=False)
+    images = [cv2.imread(image_loc) for image_loc in sorted(glob.glob(args.images))]
+    times = []
+
+    for image in images[:1] + images:
+        start = time.perf_counter()
+        try:
+            percept.generate_board_probs(image)
+        except Exception:
+            continue
+        times.append(1000 * (time.perf_counter() - start))
+
+    times = times[1:]  # warm-up
+    print(json.dumps({"reads": len(times), "median": float(np.median(times)), "mean": float(np.mean(times))}))
+
+
+def threads(args):
+    print("%-60s %6s %12s %12s" % ("budget", "reads", "median (ms)", "mean (ms)"))
+
+    for budget in args.budgets:
+        from threads import get_blas_env
+        env = dict(os.environ, **get_blas_env(parse_budget(budget)))
+        output = subprocess.run([sys.executable, os.path.abspath(__file__), "read", "--budget", budget,
+                                 "--images", args.images], env=env, stdout=subprocess.PIPE,
+                                universal_newlines=True).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        print("%-60s %6d %12.1f %12.1f" % (budget, result["reads"], result["median"], result["mean"]))
+
+
+def hold_models(backend, ready, done):
+    """
+    Description:
+        Loads the square and LAPS models as a perception worker would, runs them once so that
+        their weights are resident and keeps them loaded until done is set.
+
+    """
+    from weights import load_shared_model, load_source_model
+
+    load = load_shared_model if backend == "shared" else load_source_model
+    for model in [load("square"), load("laps")]:
+        model.predict(np.zeros((1,) + tuple(model.input_shape[1:]), dtype=np.float32), batch_size=1)
+
+    ready.set()
+    done.wait()
+
+
+def get_memory(pid):
+    """
+    Description:
+        Returns the resident and proportional set sizes of a process in MB. Shared pages are
+        divided between the processes mapping them in the latter. Linux only.
+
+    """
+    sizes = {}
+
+    with open("/proc/%d/smaps_rollup" % pid, "r") as file:
+        for line in file:
+            fields = line.split()
+            if fields[0] in ["Rss:", "Pss:"]:
+                sizes[fields[0][:-1]] = int(fields[1]) / 1024
+
+    return sizes["Rss"], sizes["Pss"]
+
+
+def memory(args):
+    context = multiprocessing.get_context("spawn")
+    print("%-8s %8s %16s %16s" % ("backend", "workers", "total RSS (MB)", "total PSS (MB)"))
+
+    for backend in args.backends:
+        for workers in range(1, args.workers + 1):
+            done = context.Event()
+            processes = []
+
+            for _ in range(workers):
+                ready = context.Event()
+                process = context.Process(target=hold_models, args=(backend, ready, done), daemon=True)
+                process.start()
+                ready.wait()
+                processes.append(process)
+
+            rss, pss = np.sum([get_memory(process.pid) for process in processes], axis=0)
+            print("%-8s %8d %16.1f %16.1f" % (backend, workers, rss, pss))
+
+            done.set()
+            for process in processes:
+                process.join()
+
+
+if __name__ == "__main__":
+    p = argparse.ArgumentParser(description='Benchmark the perception pipeline.')
+
+    p.add_argument('mode', nargs=1, type=str,
+                   help='tiers | threads | read | memory | detect | solver | llr')
+    p.add_argument('--images', type=str, default=SAMPLE_IMAGES,
+                   help='glob of chessboard images (default: SAMPLE_IMAGES)')
+    p.add_argument('--budget', type=str, default='',
+                   help='thread budget of a single read benchmark, e.g. opencv=2,tensorflow_intra=2,blas=1')
+    p.add_argument('--budgets', type=str, nargs='+',
+                   default=['opencv=1,tensorflow_intra=1,tensorflow_inter=1,blas=1',
+                            'opencv=2,tensorflow_intra=2,tensorflow_inter=1,blas=1',
+                            'opencv=2,tensorflow_intra=4,tensorflow_inter=1,blas=2',
+                            'opencv=4,tensorflow_intra=4,tensorflow_inter=2,blas=4'],
+                   help='thread budgets compared by the threads benchmark')
+    p.add_argument('--backends', type=str, nargs='+', default=['keras', 'shared'],
+                   help='model loading compared by the memory benchmark (default: keras shared)')
+    p.add_argument('--workers', type=int, default=4,
+                   help='maximum number of worker processes of the memory benchmark (default: 4)')
+    p.add_argument('--jobs', type=int, default=4,
+                   help='number of threads of the detect benchmark (default: 4)')
+    p.add_argument('--pyramid', action='store_true',
+                   help='detect on a coarse image and refine the corners at native resolution')
+    p.add_argument('--markers', type=str,
+                   help='ArUco dictionary of the corner markers, e.g. DICT_4X4_50')
+
+    args = p.parse_args()
+    mode = str(args.mode[0])
+    modes = {'tiers': tiers, 'threads': threads, 'read': read, 'memory': memory, 'detect': detect, 'solver': solver, 'llr': llr}
+
+    if mode not in modes.keys():
+        p.error("unknown mode: %s" % mode)
+
+    modes[mode](args)
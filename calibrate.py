@@ -0,0 +1,77 @@
+import argparse
+import time
+import cv2
+from utils import *
+
+
+def get_frame(args):
+    if args.image:
+        return cv2.imread(args.image)
+
+    cam = cv2.VideoCapture(args.camera)
+    ret, frame = cam.read()
+    cam.release()
+
+    if not ret:
+        raise RuntimeError("Could not read a frame from camera " + str(args.camera))
+    return frame
+
+
+def board(args):
+    from perception import PerceptionLayer
+
+    percept = PerceptionLayer(None, calibration_loc=args.output)
+    percept.calibrate_board(get_frame(args))
+    print("Saved the chessboard corners to", args.output, ":", percept.corners)
+
+
+def drift(args):
+    from perception import PerceptionLayer
+
+    percept = PerceptionLayer(None, show=False, calibration_loc=args.output)
+    if percept.corners is None:
+        p.error("the chessboard is not calibrated, run the board mode first")
+
+    frame = get_frame(args)
+    start = time.perf_counter()
+    displacement = percept.get_drift(frame)
+    ms = 1000 * (time.perf_counter() - start)
+
+    print("Lattice drift: %.2f pixels (threshold %.2f), checked in %.1f ms" % (displacement, percept.drift_threshold, ms))
+
+
+def relocalize(args):
+    from perception import PerceptionLayer
+
+    percept = PerceptionLayer(None, show=False, calibration_loc=args.output)
+    if percept.reference_score is None:
+        p.error("the chessboard is not calibrated, run the board mode first")
+
+    frame = get_frame(args)
+    start = time.perf_counter()
+    relocalized = percept.relocalize(frame)
+    ms = 1000 * (time.perf_counter() - start)
+
+    print("Re-localized:", relocalized, "in %.1f ms" % ms, "corners:", percept.corners)
+
+
+if __name__ == "__main__":
+    p = argparse.ArgumentParser(description='Calibrate the chessboard corners of a fixed camera.')
+
+    p.add_argument('mode', nargs=1, type=str,
+                   help='board | drift | relocalize')
+    p.add_argument('--image', type=str,
+                   help='overhead image of the chessboard, instead of reading the camera')
+    p.add_argument('--camera', type=int, default=0,
+                   help='index of the camera (default: 0)')
+    p.add_argument('--output', type=str, default=CALIBRATION_LOC,
+                   help='calibration file (default: CALIBRATION_LOC)')
+
+    args = p.parse_args()
+    mode = str(args.mode[0])
+    modes = {'board': board, 'drift': drift, 'relocalize': relocalize}
+
+    if mode not in modes.keys():
+        p.error("unknown mode: %s" % mode)
+
+    modes[mode](args)
@@ -7,7 +7,23 @@ WIDTH = 64
 IMAGE_DIMS = (500, 500)
 LABELS = ("b", "empty", "w")
 CLASSES = len(LABELS)
+LABEL_VALUES = {"w": 1, "b": 0, "empty": -1}
 MODEL_LOC = 'model/new_board_v3.model'
+TFLITE_MODEL_LOC = 'model/new_board_v3.tflite'
+ONNX_MODEL_LOC = 'model/new_board_v3.onnx'
+INT8_MODEL_LOC = 'model/new_board_v3.int8.tflite'
+CALIBRATION_TILES_LOC = 'model/calibration_tiles.npy'
+STUDENT_MODEL_LOC = 'model/student.h5'
+STUDENT_TFLITE_LOC = 'model/student.tflite'
+WEIGHT_STORE_LOC = 'model/weights.bin'
+LAPS_MODEL_LOC = 'misc/data/models/laps.model.json'
+LAPS_WEIGHTS_LOC = 'misc/data/models/laps.weights.h5'
+STUDENT_SIZE = 32
+MODEL_TIERS = {"fast": "student", "balanced": "tflite-int8", "accurate": "keras"}
+SQUARE_BACKEND = "keras"
+LAPS_BACKEND = "keras"
+TFLITE_BATCH_SIZES = [16, 64]
+SAMPLE_IMAGES = 'misc/test/in/*.jpg'
 CHESS_ENGINE_PATH = "stockfish/Windows/stockfish_10_x64.exe"
 COORD_DICT_LOC = "Squares.txt"
 ARDUINO_PORT = 'COM7'
@@ -16,6 +32,28 @@ VERBOSE = True
 LOGGER = True
 ROBOT_SIDE = chess.WHITE
 DIFFICULTY = 5
+CHANGE_THRESHOLD = 0.1
+CHANGE_THUMB_SIZE = 8
+CASCADE_THRESHOLDS = {"edges": 3.0, "variance": 3.0, "histogram": 3.0}
+CASCADE_BINS = 8
+VOTE_FRAMES = 3
+VOTE_METHOD = "mean"
+ARM_HOME_DELAY = 2.0
+CAMERA_BUFFER = 5
+PERCEPTION_ADDRESS = ("127.0.0.1", 5005)
+BATCH_WINDOW = 0.01
+BATCH_MAX_FRAMES = 8
+WORKER_SLOTS = 8
+CALIBRATION_LOC = 'calibration.json'
+DRIFT_THRESHOLD = 2.0
+DRIFT_POINTS = 16
+RELOCALIZE_SIZE = 500
+RELOCALIZE_MARGIN = 50
+RELOCALIZE_BAND = 0.25
+RELOCALIZE_TOLERANCE = 0.5
+DETECTOR_CONFIG = {"pyramid": False, "markers": None}
+THREAD_BUDGET = {"opencv": 2, "tensorflow_intra": 2, "tensorflow_inter": 1, "blas": 1}
+CPU_AFFINITY = {"main": None, "worker": None}
 
 with open(LOGGING_FILE, 'a', encoding="utf-8") as File:
     File.write("Logger of " + str(LOGGING_FILE))
@@ -0,0 +1,127 @@
+import argparse
+import glob
+import cv2
+import numpy as np
+from utils import *
+from inference import load_square_model
+
+
+def harvest_pairs(pattern=SAMPLE_IMAGES, student_size=STUDENT_SIZE):
+    """
+    Parameters:
+        pattern: Glob pattern of overhead chessboard images.
+        student_size: Side length of the squares fed to the student model.
+
+    Description:
+        Locates the chessboard in every image once and cuts the same squares at the input size
+        of the teacher and of the student model. Every square is also added rotated by 90, 180
+        and 270 degrees, since the camera looks straight down on the pieces.
+
+    Returns:
+        The teacher squares and the corresponding student squares.
+
+    """
+    from perception import PerceptionLayer
+
+    percept = PerceptionLayer(None, show=False)
+    teacher_tiles, student_tiles = [], []
+
+    for image_loc in sorted(glob.glob(pattern)):
+        image = cv2.imread(image_loc)
+
+        try:
+            percept.detect(image)
+        except Exception as e:
+            print("Chessboard not found in", image_loc, "skipping:", e)
+            continue
+
+        teacher = percept.extract_tiles(image, percept.corners, (HEIGHT, WIDTH))
+        student = percept.extract_tiles(image, percept.corners, (student_size, student_size))
+
+        for k in range(4):
+            teacher_tiles.append(np.rot90(teacher, k, axes=(1, 2)))
+            student_tiles.append(np.rot90(student, k, axes=(1, 2)))
+
+    return np.concatenate(teacher_tiles), np.concatenate(student_tiles)
+
+
+def build_student(size=STUDENT_SIZE):
+    """
+    Description:
+        Small purpose-built CNN for the 3-class square problem: three convolution blocks
+        followed by global average pooling and a softmax layer.
+
+    """
+    from keras.models import Sequential
+    from keras.layers import Conv2D, MaxPooling2D, BatchNormalization, GlobalAveragePooling2D, Dense
+    from keras.optimizers import Adam
+
+    model = Sequential()
+    model.add(Conv2D(16, 3, padding='same', activation='relu', input_shape=(size, size, 3)))
+    model.add(BatchNormalization())
+    model.add(MaxPooling2D(pool_size=(2, 2)))
+
+    for filters in [32, 64]:
+        model.add(Conv2D(filters, 3, padding='same', activation='relu'))
+        model.add(BatchNormalization())
+        model.add(MaxPooling2D(pool_size=(2, 2)))
+
+    model.add(GlobalAveragePooling2D())
+    model.add(Dense(CLASSES, activation='softmax'))
+    model.compile(Adam(0.001), loss='categorical_crossentropy', metrics=['categorical_accuracy'])
+    return model
+
+
+def soften(probs, temperature):
+    """
+    Description:
+        Raises the teacher probabilities to 1/temperature and renormalizes them, which is the
+        same as dividing the teacher logits by the temperature.
+
+    """
+    probs = np.power(np.clip(probs, 1e-7, 1.0), 1.0 / temperature)
+    return probs / probs.sum(axis=1, keepdims=True)
+
+
+def distill(args):
+    teacher_tiles, student_tiles = harvest_pairs(args.images, args.size)
+    teacher = load_square_model("keras", args.teacher)
+    soft_labels = soften(teacher.predict(teacher_tiles, batch_size=64), args.temperature)
+
+    order = np.random.permutation(len(student_tiles))
+    split = int(len(order) * 0.9)
+    train, val = order[:split], order[split:]
+
+    student = build_student(args.size)
+    student.fit(student_tiles[train], soft_labels[train], epochs=args.epochs, batch_size=64,
+                validation_data=(student_tiles[val], soft_labels[val]), shuffle=True)
+
+    agreement = np.mean(np.argmax(student.predict(student_tiles[val]), axis=1) ==
+                        np.argmax(soft_labels[val], axis=1))
+    print("Student agreement with the teacher on %d held-out squares: %.4f" % (len(val), agreement))
+
+    student.save(STUDENT_MODEL_LOC)
+
+    import tensorflow as tf
+    converter = tf.lite.TFLiteConverter.from_keras_model(student)
+    with open(STUDENT_TFLITE_LOC, "wb") as file:
+        file.write(converter.convert())
+
+    print("Saved the student model to", STUDENT_MODEL_LOC, "and", STUDENT_TFLITE_LOC)
+
+
+if __name__ == "__main__":
+    p = argparse.ArgumentParser(description='Distill the square model into a compact student CNN.')
+
+    p.add_argument('--teacher', type=str, default=MODEL_LOC,
+                   help='Keras teacher model (default: MODEL_LOC)')
+    p.add_argument('--images', type=str, default=SAMPLE_IMAGES,
+                   help='glob of chessboard images the squares are harvested from (default: SAMPLE_IMAGES)')
+    p.add_argument('--size', type=int, default=STUDENT_SIZE,
+                   help='side length of the student input squares (default: STUDENT_SIZE)')
+    p.add_argument('--epochs', type=int, default=30,
+                   help='number of training epochs')
+    p.add_argument('--temperature', type=float, default=2.0,
+                   help='temperature applied to the teacher probabilities')
+
+    distill(p.parse_args())
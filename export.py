@@ -0,0 +1,207 @@
+import argparse
+import glob
+import os
+import sys
+import time
+import cv2
+import numpy as np
+from utils import *
+from inference import load_square_model, get_model_loc
+
+
+def harvest_tiles(pattern=SAMPLE_IMAGES, detect=True):
+    """
+    Parameters:
+        pattern: Glob pattern of overhead chessboard images.
+        detect: Locate the chessboard in every image before cutting it into squares.
+
+    Description:
+        Cuts the matching images into preprocessed squares, exactly as PerceptionLayer does during
+        a game. If the chessboard cannot be located in an image, the whole image is used instead.
+
+    Returns:
+        A (64 * images, HEIGHT, WIDTH, 3) array of preprocessed squares.
+
+    """
+    from perception import PerceptionLayer
+
+    percept = PerceptionLayer(None, show=False)
+    tiles = []
+
+    for image_loc in sorted(glob.glob(pattern)):
+        image = cv2.imread(image_loc)
+        height, width = image.shape[:2]
+        corners = [[0, 0], [width, 0], [width, height], [0, height]]
+
+        if detect:
+            try:
+                percept.detect(image)
+                corners = percept.corners
+            except Exception as e:
+                print("Chessboard not found in", image_loc, "using the whole image:", e)
+
+        tiles.append(percept.extract_tiles(image, corners))
+
+    return np.concatenate(tiles)
+
+
+def load_tiles(args):
+    """
+    Description:
+        Returns the calibration squares saved by the harvest mode, or harvests them from the
+        images if none have been saved.
+
+    """
+    if os.path.isfile(args.tiles):
+        return np.load(args.tiles)
+    return harvest_tiles(args.images)
+
+
+def get_model_size(model_loc):
+    if os.path.isdir(model_loc):
+        return sum(os.path.getsize(os.path.join(root, name))
+                   for root, _, names in os.walk(model_loc) for name in names)
+    return os.path.getsize(model_loc)
+
+
+def predict_boards(model, tiles):
+    """
+    Description:
+        Runs the model one board (64 squares) at a time, the batch size used during a game.
+
+    """
+    return np.concatenate([model.predict(tiles[i:i + 64], batch_size=64) for i in range(0, len(tiles), 64)])
+
+
+def export_tflite(args):
+    import tensorflow as tf
+
+    model = load_square_model("keras", args.input)
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+
+    with open(args.output or TFLITE_MODEL_LOC, "wb") as file:
+        file.write(converter.convert())
+
+    print("Exported", args.input, "to", args.output or TFLITE_MODEL_LOC)
+
+
+def export_onnx(args):
+    import tensorflow as tf
+    import tf2onnx
+
+    model = load_square_model("keras", args.input)
+    spec = (tf.TensorSpec((None, HEIGHT, WIDTH, 3), tf.float32, name="input"),)
+    tf2onnx.convert.from_keras(model, input_signature=spec, output_path=args.output or ONNX_MODEL_LOC)
+
+    print("Exported", args.input, "to", args.output or ONNX_MODEL_LOC)
+
+
+def harvest(args):
+    tiles = harvest_tiles(args.images)
+    np.save(args.tiles, tiles)
+    print("Saved", len(tiles), "squares to", args.tiles)
+
+
+def quantize(args):
+    import tensorflow as tf
+
+    tiles = load_tiles(args)
+    model = load_square_model("keras", args.input)
+
+    def representative_dataset():
+        for tile in tiles[np.random.permutation(len(tiles))[:args.samples]]:
+            yield [tile[np.newaxis]]
+
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    converter.representative_dataset = representative_dataset
+    converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+    converter.inference_input_type = tf.int8
+    converter.inference_output_type = tf.int8
+
+    with open(args.output or INT8_MODEL_LOC, "wb") as file:
+        file.write(converter.convert())
+
+    print("Quantized", args.input, "to", args.output or INT8_MODEL_LOC,
+          "using", min(args.samples, len(tiles)), "calibration squares")
+
+
+def report(args):
+    tiles = load_tiles(args)
+    boards = len(tiles) // 64
+    reference = np.argmax(predict_boards(load_square_model("keras", args.input), tiles), axis=1)
+
+    print("%-12s %10s %12s %10s  %s" % ("backend", "size (MB)", "ms / board", "agreement",
+                                        "  ".join("%8s" % label for label in LABELS)))
+
+    for backend in args.backends:
+        model_loc = args.input if backend == "keras" else get_model_loc(backend)
+        model = load_square_model(backend, model_loc)
+        predict_boards(model, tiles[:64])  # warm-up
+
+        start = time.perf_counter()
+        preds = np.argmax(predict_boards(model, tiles), axis=1)
+        ms_per_board = 1000 * (time.perf_counter() - start) / boards
+
+        per_class = []
+        for index in range(CLASSES):
+            mask = reference == index
+            per_class.append("%8.4f" % np.mean(preds[mask] == index) if mask.any() else "%8s" % "-")
+
+        print("%-12s %10.2f %12.1f %10.4f  %s" % (backend, get_model_size(model_loc) / 2 ** 20, ms_per_board,
+                                                  np.mean(preds == reference), "  ".join(per_class)))
+
+
+def parity(args):
+    tiles = harvest_tiles(args.images)
+    reference = predict_boards(load_square_model("keras", args.input), tiles)
+    failed = False
+
+    for backend in args.backends:
+        preds = predict_boards(load_square_model(backend), tiles)
+        max_diff = float(np.abs(preds - reference).max())
+        agreement = float(np.mean(np.argmax(preds, axis=1) == np.argmax(reference, axis=1)))
+        print("%-8s max abs diff: %.6f  label agreement: %.4f  (%d squares)" %
+              (backend, max_diff, agreement, len(tiles)))
+
+        if max_diff > args.tolerance:
+            failed = True
+
+    if failed:
+        print("Parity check failed, tolerance:", args.tolerance)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    p = argparse.ArgumentParser(description='Export the square model to a lightweight inference runtime.')
+
+    p.add_argument('mode', nargs=1, type=str,
+                   help='tflite | onnx | parity | harvest | quantize | report')
+    p.add_argument('--input', type=str, default=MODEL_LOC,
+                   help='Keras square model (default: MODEL_LOC)')
+    p.add_argument('--output', type=str,
+                   help='exported model path (default: TFLITE_MODEL_LOC / ONNX_MODEL_LOC / INT8_MODEL_LOC)')
+    p.add_argument('--images', type=str, default=SAMPLE_IMAGES,
+                   help='glob of chessboard images used for the parity check (default: SAMPLE_IMAGES)')
+    p.add_argument('--tiles', type=str, default=CALIBRATION_TILES_LOC,
+                   help='calibration squares saved by harvest (default: CALIBRATION_TILES_LOC)')
+    p.add_argument('--samples', type=int, default=1000,
+                   help='number of calibration squares used for quantization')
+    p.add_argument('--backends', type=str, nargs='+',
+                   help='backends compared against Keras (default: tflite onnx for parity, '
+                        'keras tflite tflite-int8 for report)')
+    p.add_argument('--tolerance', type=float, default=1e-3,
+                   help='maximum absolute difference of the probabilities in the parity check')
+
+    args = p.parse_args()
+    mode = str(args.mode[0])
+    modes = {'tflite': export_tflite, 'onnx': export_onnx, 'parity': parity,
+             'harvest': harvest, 'quantize': quantize, 'report': report}
+
+    if args.backends is None:
+        args.backends = ['keras', 'tflite', 'tflite-int8'] if mode == 'report' else ['tflite', 'onnx']
+
+    if mode not in modes.keys():
+        p.error("unknown mode: %s" % mode)
+
+    modes[mode](args)
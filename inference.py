@@ -0,0 +1,193 @@
+import threading
+import numpy as np
+from config import *
+
+LAPS_MODELS = {}
+LAPS_LOCK = threading.Lock()
+
+
+class TFLiteModel:
+
+    def __init__(self, model_loc, num_threads=None, batch_sizes=TFLITE_BATCH_SIZES):
+        """
+        model_loc: Location of the .tflite square model.
+        num_threads: Number of CPU threads used by the interpreter.
+        batch_sizes: Fixed batch sizes of the interpreters, every batch is padded to one of them.
+
+        Runs the square model with the TFLite interpreter. The tflite_runtime package is used when
+        it is installed so that TensorFlow does not need to be imported. One interpreter is
+        allocated per batch size up front, so predict never resizes or reallocates the tensors.
+        """
+        try:
+            from tflite_runtime.interpreter import Interpreter
+        except ImportError:
+            from tensorflow.lite import Interpreter
+
+        self.__interpreters = {}
+
+        for batch_size in sorted(batch_sizes):
+            interpreter = Interpreter(model_path=model_loc, num_threads=num_threads)
+            details = interpreter.get_input_details()[0]
+            interpreter.resize_tensor_input(details["index"], [batch_size] + list(details["shape"][1:]))
+            interpreter.allocate_tensors()
+            self.__interpreters[batch_size] = interpreter
+
+        self.interpreter = self.__interpreters[max(self.__interpreters)]
+        self.__input = self.interpreter.get_input_details()[0]
+        self.__output = self.interpreter.get_output_details()[0]
+        self.input_shape = (None,) + tuple(self.__input["shape"][1:])
+
+
+    def predict(self, x, batch_size=None):
+        """
+        Parameters:
+            x: (N, HEIGHT, WIDTH, 3) array of preprocessed squares.
+            batch_size: Unused, kept for compatibility with the Keras predict signature.
+
+        Description:
+            Pads the batch with zeros to the smallest fixed batch size that holds it and runs it in
+            a single invocation. Batches larger than the largest size are split into chunks of it.
+            Quantized inputs and outputs are converted with the scale and zero point of the model.
+
+        """
+        x = np.asarray(x, dtype=np.float32)
+        largest = max(self.__interpreters)
+
+        if len(x) > largest:
+            return np.concatenate([self.predict(x[i: i + largest]) for i in range(0, len(x), largest)])
+
+        size = min(size for size in self.__interpreters if size >= len(x))
+        interpreter = self.__interpreters[size]
+
+        padded = np.zeros((size,) + x.shape[1:], dtype=np.float32)
+        padded[:len(x)] = x
+
+        scale, zero_point = self.__input["quantization"]
+        if self.__input["dtype"] != np.float32:
+            padded = np.round(padded / scale + zero_point).astype(self.__input["dtype"])
+
+        interpreter.set_tensor(self.__input["index"], padded)
+        interpreter.invoke()
+        y = interpreter.get_tensor(self.__output["index"])[:len(x)]
+
+        scale, zero_point = self.__output["quantization"]
+        if self.__output["dtype"] != np.float32:
+            y = (y.astype(np.float32) - zero_point) * scale
+
+        return y
+
+
+class ONNXModel:
+
+    def __init__(self, model_loc, num_threads=None, initializers=None):
+        """
+        model_loc: Location of the .onnx square model.
+        num_threads: Number of CPU threads used by ONNX Runtime.
+        initializers: Dictionary of initializer name -> array, used in place of the weights stored in
+                      the model. ONNX Runtime uses the arrays directly, without copying them.
+
+        Runs the square model with ONNX Runtime on the CPU.
+        """
+        import onnxruntime
+
+        options = onnxruntime.SessionOptions()
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+
+        if initializers:
+            # Prepacking would copy the weights into buffers owned by the session
+            options.add_session_config_entry("session.disable_prepacking", "1")
+            options.add_external_initializers(
+                list(initializers.keys()),
+                [onnxruntime.OrtValue.ortvalue_from_numpy(array) for array in initializers.values()])
+            self.__initializers = initializers
+
+        self.session = onnxruntime.InferenceSession(model_loc, options, providers=["CPUExecutionProvider"])
+        self.__input = self.session.get_inputs()[0].name
+        self.input_shape = (None,) + tuple(self.session.get_inputs()[0].shape[1:])
+
+
+    def predict(self, x, batch_size=None):
+        """
+        Parameters:
+            x: (N, HEIGHT, WIDTH, 3) array of preprocessed squares.
+            batch_size: Unused, kept for compatibility with the Keras predict signature.
+
+        """
+        return self.session.run(None, {self.__input: np.asarray(x, dtype=np.float32)})[0]
+
+
+def import_keras():
+    """
+    Description:
+        Imports Keras in inference mode. Only the Keras backends call it, so choosing the TFLite
+        or ONNX backend does not load TensorFlow.
+
+    """
+    import keras
+    keras.backend.set_learning_phase(0)
+    return keras
+
+
+def get_model_loc(backend):
+    """
+    Description:
+        Returns the configured location of the square model for the given backend.
+
+    """
+    return {"keras": MODEL_LOC, "tflite": TFLITE_MODEL_LOC, "tflite-int8": INT8_MODEL_LOC,
+            "onnx": ONNX_MODEL_LOC, "student": STUDENT_TFLITE_LOC, "shared": WEIGHT_STORE_LOC}[backend]
+
+
+def load_square_model(backend=SQUARE_BACKEND, model_loc=None):
+    """
+    Parameters:
+        backend: "keras", "tflite", "tflite-int8", "onnx", "student" or "shared".
+        model_loc: Location of the model, defaults to the location configured for the backend.
+
+    Description:
+        Loads the square model for the given inference backend. Every backend exposes a Keras
+        style predict method, so the result can be passed to PerceptionLayer directly. The "shared"
+        backend runs the square model on the weights packed by weights.py, which are mapped
+        read-only and shared by all the processes that load them.
+
+    """
+    if backend not in ["keras", "tflite", "tflite-int8", "onnx", "student", "shared"]:
+        raise ValueError("Unknown square model backend: " + str(backend))
+
+    model_loc = model_loc or get_model_loc(backend)
+
+    if backend == "keras":
+        return import_keras().models.load_model(model_loc)
+    elif backend == "shared":
+        from weights import load_shared_model
+        return load_shared_model("square", model_loc)
+    elif backend == "onnx":
+        return ONNXModel(model_loc, THREAD_BUDGET["tensorflow_intra"])
+    else:
+        return TFLiteModel(model_loc, THREAD_BUDGET["tensorflow_intra"])
+
+
+def load_laps_model(backend=LAPS_BACKEND):
+    """
+    Parameters:
+        backend: "keras" or "shared".
+
+    Description:
+        Loads the LAPS model used by board detection. The "keras" backend returns None, in which
+        case the detector loads the model from its own files when it is first needed. The "shared"
+        backend runs it on the weights packed by weights.py. It is loaded once per process, so the
+        model warmed up by ModelManager is the one the detector uses.
+
+    """
+    if backend not in ["keras", "shared"]:
+        raise ValueError("Unknown LAPS model backend: " + str(backend))
+
+    if backend == "keras":
+        return None
+
+    with LAPS_LOCK:
+        if backend not in LAPS_MODELS:
+            from weights import load_shared_model
+            LAPS_MODELS[backend] = load_shared_model("laps")
+        return LAPS_MODELS[backend]
@@ -1,18 +1,15 @@
+from threads import configure_threads
 import serial
 from utils import *
 from controller import ControllerLayer
-from perception import PerceptionLayer
 from application import ApplicationLayer
-from keras.models import load_model
-import config
-import sys
+from worker import PerceptionWorker
 import cv2
+import time
 
 if __name__ == "__main__":
 
-    # Initialize Perception Layer
-    model = load_model(MODEL_LOC)
-    perceptLayer = PerceptionLayer(model)
+    configure_threads(role="main")
 
     # Initialize Controller layer
     arduino = serial.Serial(ARDUINO_PORT, 9600)
@@ -20,42 +17,81 @@ if __name__ == "__main__":
     
     # Initialize camera
     cam = cv2.VideoCapture(0)
+    ret, initial_board_img = cam.read()
+    if not ret:
+        cam.release()
+        arduino.close()
+        raise SystemExit("Could not read a frame from the camera, check that it is connected")
+
+    # Initialize Perception Layer in a separate process
+    perceptWorker = PerceptionWorker(initial_board_img.shape)
     
     # Generate initial board array
-    ret, initial_board_img = cam.read()
     show_img(initial_board_img)
-    starting_arr = perceptLayer.generate_board_arr(initial_board_img)
+    perceptWorker.submit("read", perceptWorker.capture_frames(cam, 1))
+    starting_probs = perceptWorker.wait("read")
+    if starting_probs is None:  # The error has been reported by the worker
+        perceptWorker.close()
+        cam.release()
+        arduino.close()
+        raise SystemExit("Could not read the initial board, check that the whole chessboard is in view")
+    starting_arr = get_board_arr(starting_probs.reshape((64, CLASSES)), LABELS)
     print("Initial Board Array\n", starting_arr)
+    perceptWorker.submit("calibrate", (), starting_arr)
     
     # Initialize Application Layer
     chess_board = ApplicationLayer(ROBOT_SIDE, starting_arr)
     chess_board.display()
+    reading = False
     
     try:
         while True:
-            ret, image = cam.read()
+            slot, image = perceptWorker.capture(cam)
             cv2.imshow("Board Image", image)
             key = cv2.waitKey(1)
+
+            # Results arrive from the perception process without blocking the preview
+            result = perceptWorker.poll()
+            if result is not None and result[0] == "read" and result[1] is not None:
+                chess_board.move(a_board_probs=result[1])
+                chess_board.display()
+                reading = False
+            elif result is not None and result[0] == "read":
+                reading = False
+            elif result is not None and result[0] == "verify" and result[1]:
+                print("The robot's move was not completed correctly, please fix the board")
     
             if key % 256 == 27:  # Escape
                 break
+
+            elif key % 256 == ord('r'):  # Reload the square model
+                perceptWorker.submit("swap")
+
+            elif key % 256 == ord('c'):  # Detect the chessboard again and store its corners
+                perceptWorker.submit("calibrate_board", perceptWorker.capture_frames(cam, 1))
     
-            elif key % 56 == 32:  # Space-bar
+            elif key % 56 == 32 and not reading:  # Space-bar
                 if chess_board.is_robots_turn():
                     chess_board.move()
                     move = chess_board.get_move_details()
                     controlLayer.send_to_arduino(move)
+
+                    # The Arduino acknowledges the move before the arm is back home
+                    time.sleep(ARM_HOME_DELAY)
+                    perceptWorker.drain(cam)
+                    perceptWorker.submit("verify", perceptWorker.capture_frames(cam, VOTE_FRAMES),
+                                         chess_board.get_move_squares(move))
+                    chess_board.display()
     
                 else:
-                    board_arr = perceptLayer.generate_board_arr(image) 
-                    chess_board.move(board_arr) 
-
-                chess_board.display()
+                    perceptWorker.submit("read", perceptWorker.capture_frames(cam, VOTE_FRAMES))
+                    reading = True
     
     except Exception as e:
         print(e)
         arduino.close()
     
+    perceptWorker.close()
     cam.release()
     cv2.destroyAllWindows()
     arduino.close()
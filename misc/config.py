@@ -1,8 +1,21 @@
 from time import time
 
-NC_LAYER = 0
-NC_IMAGE = object
 NC_CLOCK = time()
 NC_DEBUG = False # True
 
-NC_CONFIG = {'layers': 3}
+NC_CONFIG = {'layers': 3,      # maximum number of layers
+             'min_layers': 1,  # layers run before checking convergence
+             'inliers': 4,     # max difference of LAPS points to 49
+             'quality': 0.3,   # min scale free LLR score (llr_quality)
+             'shift': 0.01,    # max corner shift between layers (board side)
+             'solver': 'llr',  # lattice solver, 'llr' or 'ransac'
+             'height': 500,    # working image size
+             'pyramid': False, # coarse detection, refined at native resolution
+             'coarse': 200,    # working image size of the coarse detection
+             'window': 0.25,   # refinement window (square side)
+             'markers': None,  # ArUco dictionary, e.g. 'DICT_4X4_50' (None: off)
+             'marker_ids': [0, 1, 2, 3], # markers at the TL, TR, BR, BL corners
+             'marker_offset': 0.75, # marker centre, diagonally out of the corner
+             'marker_size': 1.0, # marker side (squares)
+             'min_markers': 3, # fewer visible markers fall back to SLID/LAPS/LLR
+             'save': False}
@@ -1,25 +1,35 @@
-from keras.optimizers import RMSprop
-from keras.models import Sequential
-from keras.layers import *
+NC_LAPS_NETWORK = None
 
-# input
-model = Sequential()
-model.add(Dense(441, input_shape=(21,21,1)))
+def laps_model():
+	"""untrained laps network, built (and keras imported) on first use"""
+	global NC_LAPS_NETWORK
+	if NC_LAPS_NETWORK is not None: return NC_LAPS_NETWORK
 
-# H(2)
-for i in range(2):
-	for j in [3, 2, 1]:
-		model.add(Conv2D(16, j, activation='elu'))
-	model.add(MaxPooling2D(pool_size=(2, 2)))
-	model.add(BatchNormalization())
+	from keras.optimizers import RMSprop
+	from keras.models import Sequential
+	from keras.layers import Dense, Conv2D, MaxPooling2D, BatchNormalization, Dropout, Flatten
 
-# F(128)
-model.add(Dense(128, activation='elu'))
-model.add(Dropout(0.5))
-model.add(Flatten())
+	# input
+	model = Sequential()
+	model.add(Dense(441, input_shape=(21,21,1)))
 
-# output
-model.add(Dense(2, activation='softmax'))
-model.compile(RMSprop(lr=0.001),
-              loss='categorical_crossentropy',
-              metrics=['categorical_accuracy'])
+	# H(2)
+	for i in range(2):
+		for j in [3, 2, 1]:
+			model.add(Conv2D(16, j, activation='elu'))
+		model.add(MaxPooling2D(pool_size=(2, 2)))
+		model.add(BatchNormalization())
+
+	# F(128)
+	model.add(Dense(128, activation='elu'))
+	model.add(Dropout(0.5))
+	model.add(Flatten())
+
+	# output
+	model.add(Dense(2, activation='softmax'))
+	model.compile(RMSprop(lr=0.001),
+	              loss='categorical_crossentropy',
+	              metrics=['categorical_accuracy'])
+
+	NC_LAPS_NETWORK = model
+	return model
@@ -0,0 +1,120 @@
+import misc.utils
+from misc.config import *
+from misc.utils import ImageObject, image_order, image_project, image_homography, image_transform
+from misc.slid import pSLID, SLID, slid_tendency
+from misc.laps import LAPS
+from misc.llr import LLR, llr_pad, llr_quality, llr_extrapolate
+from misc.lattice import RANSAC
+from misc.markers import marker_corners
+
+import cv2, numpy as np
+na = np.array
+save = cv2.imwrite
+
+################################################################################
+
+def corner_shift(corners, prev):
+	"""largest corner movement, relative to the board side"""
+	if prev is None: return float('inf')
+	dist = np.linalg.norm(na(corners)[:, None] - na(prev)[None], axis=2)
+	side = cv2.arcLength(np.float32(prev).reshape(-1, 1, 2), True) / 4
+	return float(dist.min(axis=1).max() / side)
+
+class Detector(object):
+	"""reentrant SLID -> LAPS -> LLR chessboard detector"""
+
+	def __init__(self, config=None, laps_model=None):
+		"""configuration (NC_CONFIG keys) and LAPS model, shared by all runs"""
+		self.config = dict(NC_CONFIG, **(config or {}))
+		self.laps_model = laps_model # None: misc/data/models, loaded on first use
+
+	def converged(self, report):
+		"""convergence criteria of a layer"""
+		if report['layer'] < self.config['min_layers']: return False
+		lattice = abs(49 - report['points']) <= self.config['inliers'] and \
+			report['quality'] >= self.config['quality']
+		return lattice or report['shift'] <= self.config['shift']
+
+	def solve(self, img, points, lines):
+		"""inner lattice quad and its score, RANSAC falls back to LLR without a full lattice"""
+		if self.config['solver'] == 'ransac':
+			try:
+				return RANSAC(img, points, score=True)
+			except ValueError as e:
+				misc.utils.warn("RANSAC failed, using LLR: " + str(e))
+		return LLR(img, points, lines, score=True)
+
+	def layer(self, image, layer, prev=None):
+		"""find the chessboard in the current layer and crop to it"""
+		scale = image.height / 500.0 # parameters are tuned for 500px
+		segments = pSLID(image['main'], scale=scale)
+		raw_lines = SLID(image['main'], segments)
+		lines = slid_tendency(raw_lines)
+		points = LAPS(image['main'], lines, size=max(4, int(10 * scale)), model=self.laps_model)
+		inner_points, score = self.solve(image['main'], points, lines)
+
+		# chessboard corners in the original frame, if it stops here
+		corners = image_project(llr_extrapolate(inner_points), np.linalg.inv(image.transform))
+		report = {'layer': layer, 'points': len(points),
+			'quality': float(llr_quality(score, inner_points, points)),
+			'shift': corner_shift(corners, prev)}
+		report['converged'] = self.converged(report)
+
+		if report['converged']:
+			image.crop(llr_extrapolate(inner_points))
+		else:
+			four_points = llr_pad(inner_points, image['main'], pad=int(60 * scale))
+			try:
+				image.crop(four_points)
+			except:
+				misc.utils.warn("Next layer is not needed")
+				image.crop(inner_points)
+
+		if self.config['save']: save(str(layer) + ".png", image.board())
+		return report, corners
+
+	def refine(self, img, corners):
+		"""refine the corners at native resolution, in windows around the lattice"""
+		grid = np.float32([[x, y] for y in range(1, 8) for x in range(1, 8)])
+		M = image_homography(corners, (8, 8))
+		lattice = np.float32(image_project(grid, np.linalg.inv(M)))
+
+		# only the region around the chessboard is converted and searched
+		side = cv2.arcLength(np.float32(corners).reshape(-1, 1, 2), True) / 32
+		win = max(2, int(side * self.config['window']))
+		x, y, w, h = cv2.boundingRect(lattice)
+		x, y = max(0, x - 2 * win), max(0, y - 2 * win)
+		roi = img[y:y + h + 4 * win, x:x + w + 4 * win]
+		grey = cv2.cvtColor(roi, cv2.COLOR_BGR2GRAY)
+
+		criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 20, 0.05)
+		start = np.float32(lattice - [x, y]).reshape(-1, 1, 2) # cornerSubPix takes float32 only
+		refined = cv2.cornerSubPix(grey, start.copy(), (win, win), (-1, -1), criteria)
+		refined = refined.reshape(-1, 2) + [x, y]
+
+		# points hidden by pieces are outliers of the lattice homography
+		H, mask = cv2.findHomography(grid, refined, cv2.RANSAC, max(1.0, side * 0.05))
+		if H is None or mask.sum() < 8: return corners
+		return image_project([[0, 0], [8, 0], [8, 8], [0, 8]], H)
+
+	def detect(self, img, report=None):
+		"""four chessboard corners in img and the cropped chessboard"""
+		if self.config['markers'] is not None:
+			points, found = marker_corners(img, self.config)
+			if report is not None: report.append({'layer': 0, 'markers': found,
+				'converged': points is not None})
+			if points is not None: return points, image_transform(img, points)
+
+		pyramid = self.config['pyramid']
+		height = self.config['coarse'] if pyramid else self.config['height']
+		image, corners = ImageObject(img, height), None # all state of this run
+		for layer in range(1, self.config['layers'] + 1):
+			result, corners = self.layer(image, layer, corners)
+			if report is not None: report.append(result)
+			if NC_DEBUG: print("LAYER", result)
+			if result['converged']: break
+		# crops can mirror the layer (llr_polysort order from the corner nearest the
+		# origin), so the corner order depends on the layers run: made canonical here
+		points = self.refine(img, image.points) if pyramid else image.points
+		points = image_order(points)
+		return points, image_transform(img, points)
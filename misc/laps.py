@@ -1,16 +1,25 @@
-import misc.utils, misc.debug, misc.deps
+import misc.utils, misc.debug, misc.deps.geometry
 
-import collections
+import collections, threading
 import cv2, numpy as np
 import scipy, scipy.cluster
 from misc.config import *
 
-from keras.models import model_from_json
-
 __laps_model = 'misc/data/models/laps.model.json'
 __laps_weights = 'misc/data/models/laps.weights.h5'
-NC_LAPS_MODEL = model_from_json(open(__laps_model, 'r').read())
-NC_LAPS_MODEL.load_weights(__laps_weights)
+NC_LAPS_MODEL = None
+NC_LAPS_LOCK = threading.Lock()
+
+def laps_model():
+	"""laps model from its own files, loaded once on first use"""
+	global NC_LAPS_MODEL
+	with NC_LAPS_LOCK: # the model manager warms it up on its own thread
+		if NC_LAPS_MODEL is None:
+			from keras.models import model_from_json
+			model = model_from_json(open(__laps_model, 'r').read())
+			model.load_weights(__laps_weights)
+			NC_LAPS_MODEL = model
+	return NC_LAPS_MODEL
 
 #from keras.utils import plot_model, print_summary
 #plot_model(NC_LAPS_MODEL, show_shapes=True, to_file='model.png')
@@ -36,10 +45,8 @@ def laps_cluster(points, max_dist=10):
 		                        np.mean(np.array(arr)[:,1])), clusters)
 	return list(clusters) # if two points are close, they become one mean point
 
-def laps_detector(img):
+def laps_detector(img, model=None):
 	"""determine if that shape is positive"""
-	global NC_LAYER
-
 	hashid = str(hash(img.tostring()))
 
 	img = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
@@ -73,7 +80,8 @@ def laps_detector(img):
 	
 	if i == 4: return (True, 1)
 
-	pred = NC_LAPS_MODEL.predict(X)
+	if model is None: model = laps_model()
+	pred = model.predict(X)
 	a, b = pred[0][0], pred[0][1]
 	t = a > b and b < 0.03 and a > 0.975
 
@@ -85,12 +93,19 @@ def laps_detector(img):
 		#debug.image(imgd).save("NO" + str(hash(str(imgd))), prefix=False)
 		return (False, pred[0])
 
+def laps_near(points, seeds, radius):
+	"""keep the points within radius of any seed point"""
+	if len(points) == 0: return points
+	dist = scipy.spatial.distance.cdist(np.array(points), np.array(seeds))
+	return [pt for pt, d in zip(points, dist.min(axis=1)) if d <= radius]
+
 ################################################################################
 
-def LAPS(img, lines, size=10):
+def LAPS(img, lines, size=10, seeds=None, radius=10, model=None):
 	# print(utils.call("LAPS(img, lines)"))
 
 	__points, points = laps_intersections(lines), []
+	if seeds is not None: __points = laps_near(__points, seeds, radius)
 	# debug.image(img).points(__points, size=3).save("laps_in_queue")
 
 	for pt in __points:
@@ -109,13 +124,13 @@ def LAPS(img, lines, size=10):
 		if dimg_shape[0] <= 0 or dimg_shape[1] <= 0: continue
 
 		# use neural network
-		re_laps = laps_detector(dimg)
+		re_laps = laps_detector(dimg, model)
 		if not re_laps[0]: continue
 
 		# add if okay
 		if pt[0] < 0 or pt[1] < 0: continue
 		points += [pt]
-	points = laps_cluster(points)
+	points = laps_cluster(points, max_dist=size)
 
 	# debug.image(img).points(points, size=5, \
 	# 	color=debug.color()).save("laps_good_points")
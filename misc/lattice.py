@@ -0,0 +1,84 @@
+import scipy, scipy.spatial
+import cv2, math, numpy as np
+na = np.array
+
+from misc.llr import llr_normalize, llr_correctness, llr_polysort, llr_polyscore, llr_cluster
+
+################################################################################
+
+def lattice_project(pts, M):
+	"""apply perspective matrix to an (N, 2) array of points"""
+	return cv2.perspectiveTransform(np.float32(pts).reshape(-1, 1, 2), M).reshape(-1, 2)
+
+def lattice_inliers(pts, M, tol):
+	"""lattice coordinates of the points and which of them are near a node"""
+	grid = lattice_project(pts, np.linalg.inv(M))
+	return grid, np.abs(grid - np.round(grid)).max(axis=1) < tol
+
+def lattice_fit(points, iters=200, tol=0.2, seed=0):
+	"""projective lattice fitted to the points with RANSAC over unit cells"""
+	pts = np.float32(points)
+	if len(pts) < 4: raise ValueError("too few points for a lattice")
+	tree = scipy.spatial.cKDTree(pts)
+	_, nbrs = tree.query(pts, k=min(5, len(pts)))
+	rng = np.random.RandomState(seed) # repeatable detections
+	cell = np.float32([[0, 0], [1, 0], [1, 1], [0, 1]])
+
+	best, best_count = None, 0
+	for _ in range(iters):
+		# a point and two of its neighbours span a cell (p, a, c, b)
+		i = rng.randint(len(pts)); p = pts[i]
+		a, b = pts[rng.choice(nbrs[i][1:], 2, replace=False)]
+		u, v = a - p, b - p
+		if abs(u[0]*v[1] - u[1]*v[0]) < 0.5 * np.linalg.norm(u) * np.linalg.norm(v):
+			continue # (almost) collinear
+		d, j = tree.query(a + b - p)
+		if d > tol * min(np.linalg.norm(u), np.linalg.norm(v)): continue
+
+		M = cv2.getPerspectiveTransform(cell, np.float32([p, a, pts[j], b]))
+		_, inliers = lattice_inliers(pts, M, tol)
+		if np.count_nonzero(inliers) > best_count:
+			best, best_count = M, np.count_nonzero(inliers)
+
+	if best is None: raise ValueError("no lattice cell found")
+
+	# refine on all the inliers (far nodes are off in the cell estimate)
+	for _ in range(3):
+		grid, inliers = lattice_inliers(pts, best, tol)
+		if np.count_nonzero(inliers) < 4: break
+		best, _ = cv2.findHomography(np.round(grid[inliers]), pts[inliers])
+	grid, inliers = lattice_inliers(pts, best, tol)
+	return best, grid, inliers
+
+def lattice_span(coords, n=7):
+	"""n consecutive lattice lines with the most points"""
+	lo, hi = int(coords.min()), int(coords.max())
+	if hi - lo < n - 1: raise ValueError("the points span %d lattice lines, not %d" % (hi - lo + 1, n))
+	if hi - lo < n: return lo, hi
+	counts = [np.count_nonzero((coords >= s) & (coords < s + n)) \
+		for s in range(lo, hi - n + 2)]
+	s = lo + int(np.argmax(counts))
+	return s, s + n - 1
+
+################################################################################
+
+def RANSAC(img, points, score=False):
+	"""inner lattice quad of the LAPS points (alternative to LLR, without the lines)"""
+	points = llr_correctness(llr_normalize(points), img.shape)
+	M, grid, inliers = lattice_fit(points)
+
+	nodes = np.round(grid[inliers]).astype(int)
+	x0, x1 = lattice_span(nodes[:, 0])
+	y0, y1 = lattice_span(nodes[:, 1])
+	quad = lattice_project([[x0, y0], [x1, y0], [x1, y1], [x0, y1]], M)
+	four_points = llr_normalize(llr_polysort(quad.tolist()))
+	if not score: return four_points
+
+	# scored like the LLR candidates, against the same points
+	points = llr_cluster(points, img.shape)
+	alfa = math.sqrt(cv2.contourArea(na(points))/49)
+	beta = len(points)*(5/100)
+	x, y = [p[0] for p in points], [p[1] for p in points]
+	centroid = (sum(x) / len(points), sum(y) / len(points))
+	return four_points, llr_polyscore(np.int32(four_points), points, centroid, \
+		beta=beta, alfa=alfa/2)
@@ -1,4 +1,4 @@
-import misc.utils, misc.debug
+import misc.utils, misc.debug, misc.deps.geometry
 
 import scipy, cv2, pyclipper, numpy as np
 import matplotlib.path, matplotlib.pyplot as plt
@@ -39,6 +39,26 @@ def llr_polysort(pts):
 	pts.sort(key=__sort)
 	return pts
 
+def llr_cluster(points, shape):
+	"""points in the image, of the largest DBSCAN cluster (the ones LLR fits)"""
+	points = llr_correctness(llr_normalize(points), shape) # popraw punkty
+
+	# --- clustrowanie
+	import sklearn.cluster
+	__points = {}; points = llr_polysort(points); __max, __points_max = 0, []
+	alfa = math.sqrt(cv2.contourArea(na(points))/49)
+	X = sklearn.cluster.DBSCAN(eps=alfa*4).fit(points) # **(1.3)
+	for i in range(len(points)): __points[i] = []
+	for i in range(len(points)):
+		if X.labels_[i] != -1: __points[X.labels_[i]] += [points[i]]
+	for i in range(len(points)):
+		if len(__points[i]) > __max:
+			__max = len(__points[i]); __points_max = __points[i]
+	if len(__points) > 0 and len(points) > 49/2: points = __points_max
+	# print(X.labels_)
+	# ---
+	return points
+
 def llr_polyscore(cnt, pts, cen, alfa=5, beta=2):
 	a = cnt[0]; b = cnt[1]
 	c = cnt[2]; d = cnt[3]
@@ -148,11 +168,207 @@ def llr_polyscore(cnt, pts, cen, alfa=5, beta=2):
 	# 0.0036616950969009555 128126.0 139323.0 41 11197.0
 	# 0.00581757739455641   137893.0 145112.5 42 7219.5
 
+def llr_round(v):
+	"""Round of clipper.cpp (halves away from zero)"""
+	return np.where(v < 0, np.trunc(v - 0.5), np.trunc(v + 0.5))
+
+def llr_offset(cnts, delta, limit=2.0):
+	"""pyclipper JT_MITER offset of the quads, 3 vertices per corner (C, 12, 2)"""
+	q = na(cnts, dtype=np.float64).reshape(-1, 4, 2)
+	x, y = q[..., 0], q[..., 1] # FixOrientations: positive Area
+	area = -((np.roll(x, 1, axis=1) + x) * (np.roll(y, 1, axis=1) - y)).sum(axis=1) * 0.5
+	q = np.where((area < 0)[:, None, None], q[:, ::-1], q)
+	d = np.roll(q, -1, axis=1) - q # GetUnitNormal
+	with np.errstate(divide='ignore'):
+		f = 1 * 1.0 / np.sqrt(d[..., 0] * d[..., 0] + d[..., 1] * d[..., 1])
+	n = np.nan_to_num(np.stack([d[..., 1] * f, -(d[..., 0] * f)], axis=2))
+	lim = 2 / (limit * limit) if limit > 2 else 0.5
+
+	# OffsetPoint(j, k), every corner as 3 points (repeated when fewer)
+	out, c, k = np.zeros((len(q), 4, 3, 2)), np.arange(len(q)), np.full(len(q), 3)
+	for j in range(4):
+		nk, nj, s = n[c, k], n[:, j], q[:, j]
+		sinA = nk[:, 0] * nj[:, 1] - nj[:, 0] * nk[:, 1]
+		cosA = nk[:, 0] * nj[:, 0] + nj[:, 1] * nk[:, 1]
+		small = np.abs(sinA * delta) < 1.0
+		flat = small & (cosA > 0)
+		sinA = np.where(small, sinA, np.clip(sinA, -1.0, 1.0))
+		r = 1 + (nj[:, 0] * nk[:, 0] + nj[:, 1] * nk[:, 1])
+		dx = np.tan(np.arctan2(sinA, nk[:, 0] * nj[:, 0] + nk[:, 1] * nj[:, 1]) / 4)
+		with np.errstate(divide='ignore', invalid='ignore'):
+			miter = llr_round(s + (nk + nj) * (delta / r)[:, None])
+		square = [llr_round(np.stack([s[:, 0] + delta * (nk[:, 0] - nk[:, 1] * dx),
+		                              s[:, 1] + delta * (nk[:, 1] + nk[:, 0] * dx)], axis=1)),
+		          llr_round(np.stack([s[:, 0] + delta * (nj[:, 0] + nj[:, 1] * dx),
+		                              s[:, 1] + delta * (nj[:, 1] - nj[:, 0] * dx)], axis=1))]
+		pk, pj = llr_round(s + nk * delta), llr_round(s + nj * delta)
+
+		concave = (~flat & (sinA * delta < 0))[:, None]
+		mitered = (~flat & (sinA * delta >= 0) & (r >= lim))[:, None]
+		for i, (a, b) in enumerate([(pk, square[0]), (s, square[1]), (pj, square[1])]):
+			out[:, j, i] = np.where(flat[:, None], pk, np.where(concave, a, np.where(mitered, miter, b)))
+		k = np.where(flat, k, j) # k is kept after a flat corner
+	return out.reshape(len(q), 12, 2)
+
+def llr_inside(polys, pts):
+	"""matplotlib contains_points of the closed polygons (C, V, 2), as (C, N)"""
+	w0 = polys[:, None]
+	w1 = np.roll(polys, -1, axis=1)[:, None]
+	tx, ty = pts[None, :, None, 0], pts[None, :, None, 1]
+	y0, y1 = w0[..., 1] >= ty, w1[..., 1] >= ty
+	hit = ((w1[..., 1] - ty) * (w0[..., 0] - w1[..., 0]) >= \
+		(w1[..., 0] - tx) * (w0[..., 1] - w1[..., 1])) == y1
+	return np.bitwise_xor.reduce((y0 != y1) & hit, axis=2)
+
+def llr_polyscores(cnts, pts, cen, alfa=5, beta=2):
+	"""llr_polyscore of many (convex) quads at once, as an array"""
+	cnts = na(cnts, dtype=np.int64).reshape(-1, 4, 2)
+	pts = na(pts, dtype=np.int64).reshape(-1, 2)
+	scores = np.zeros(len(cnts))
+	gamma = alfa/1.5
+
+	# (1) # za mala powierzchnia
+	x, y = cnts[..., 0], cnts[..., 1]
+	area = np.abs((x * np.roll(y, -1, axis=1) - np.roll(x, -1, axis=1) * y).sum(axis=1)) / 2
+	live = np.flatnonzero(area >= (4 * alfa * alfa) * 5)
+	if len(live) == 0 or len(pts) == 0: return scores
+
+	# (2) # za malo punktow
+	wtfs = llr_inside(llr_offset(cnts[live], gamma), pts)
+	count = np.count_nonzero(wtfs, axis=1)
+	keep = np.minimum(count, 49) >= min(len(pts), 49) - 2 * beta - 1
+
+	# (3)
+	for i, inside, n in zip(live[keep], wtfs[keep], count[keep]):
+		pcnt_in = pts[inside]
+		cnt_in = pcnt_in[scipy.spatial.ConvexHull(pcnt_in).vertices] # E sums in its order
+		cen2 = (cnt_in[:, 0].sum() / len(cnt_in), cnt_in[:, 1].sum() / len(cnt_in))
+		G = np.linalg.norm(na(cen)-na(cen2))
+
+		l0, l1 = cnts[i], np.roll(cnts[i], -1, axis=0) # a, b, c, d
+		u, v = l1 - l0, l0[:, None] - cnt_in[None]
+		r = np.abs(u[:, None, 0] * v[..., 1] - u[:, None, 1] * v[..., 0]) / \
+			np.sqrt((u * u).sum(axis=1))[:, None]
+		near = r[r < gamma]
+		if len(near) == 0: continue
+		E = sum(near.tolist()) / len(near)
+
+		A = min(int(n), 49)
+		B = float(area[i])
+		C = 1+(E/A)**(1/3)  # rownosc
+		D = 1+(G/A)**(1/5)  # centroid
+		scores[i] = (A**4)/((B**2) * C * D)
+	return scores
+
+################################################################################
+
+def llr_isect(A, B):
+	"""intersections of segments A[i] and B[j] (and if any, and if on an ending)"""
+	def __gt(a, b): return (a[..., 0] > b[..., 0]) | ((a[..., 0] == b[..., 0]) & (a[..., 1] > b[..., 1]))
+	def __sorted(S): return np.where(__gt(S[:, 0], S[:, 1])[:, None, None], S[:, ::-1], S)
+	def __dot(a, b): return (a[..., 0] * b[..., 0]) + (a[..., 1] * b[..., 1])
+	def __fac(p, l1, l2):
+		u, h = l2 - l1, p - l1
+		return np.where(__dot(u, u) != 0, __dot(u, h) / __dot(u, u), -1.0)
+
+	# isect_seg_seg_v2_point, with its order of the segments and operations
+	S, T = np.broadcast_arrays(__sorted(na(A, dtype=np.float64))[:, None],
+	                           __sorted(na(B, dtype=np.float64))[None])
+	swap = __gt(S[..., 0, :], T[..., 0, :]) | \
+		(np.all(S[..., 0, :] == T[..., 0, :], axis=-1) & __gt(S[..., 1, :], T[..., 1, :]))
+	S, T = np.where(swap[..., None, None], T, S), np.where(swap[..., None, None], S, T)
+	(v1, v2), (v3, v4) = np.moveaxis(S, -2, 0), np.moveaxis(T, -2, 0)
+
+	with np.errstate(divide='ignore', invalid='ignore'):
+		div = (v2[..., 0] - v1[..., 0]) * (v4[..., 1] - v3[..., 1]) - \
+		      (v2[..., 1] - v1[..., 1]) * (v4[..., 0] - v3[..., 0])
+		c12 = v1[..., 0] * v2[..., 1] - v1[..., 1] * v2[..., 0]
+		c34 = v3[..., 0] * v4[..., 1] - v3[..., 1] * v4[..., 0]
+		pts = np.stack([((v3[..., 0] - v4[..., 0]) * c12 - (v1[..., 0] - v2[..., 0]) * c34) / div,
+		                ((v3[..., 1] - v4[..., 1]) * c12 - (v1[..., 1] - v2[..., 1]) * c34) / div], axis=-1)
+		fac1, fac2 = __fac(pts, v1, v2), __fac(pts, v3, v4)
+	ok = (div != 0) & (fac1 >= 0) & (fac1 <= 1) & (fac2 >= 0) & (fac2 <= 1)
+
+	# USE_IGNORE_SEGMENT_ENDINGS: skip the points that end both segments
+	def __end(p, q): return __dot(p - q, p - q) < misc.deps.geometry.EPS_SQ
+	end1, end2 = __end(pts, v1) | __end(pts, v2), __end(pts, v3) | __end(pts, v4)
+	ok &= ~(end1 & end2)
+	return pts, ok, ok & (end1 | end2)
+
+def llr_candidates(vs, hs, shape):
+	"""quads of 2 vertical and 2 horizontal lines with 4 intersections in the image (in LLR order)"""
+	iv, jv = na(list(itertools.combinations(range(len(vs)), 2)), dtype=int).reshape(-1, 2).T
+	ih, jh = na(list(itertools.combinations(range(len(hs)), 2)), dtype=int).reshape(-1, 2).T + len(vs)
+	if len(iv) == 0 or len(ih) == 0: return np.zeros((0, 4, 2), dtype=int), np.zeros(0, dtype=int)
+
+	# laps_intersections and llr_correctness of every pair of lines
+	lines = list(vs) + list(hs)
+	pts, ok, end = llr_isect(lines, lines)
+	ok &= (pts[..., 0] >= 0) & (pts[..., 1] >= 0) & \
+		(pts[..., 0] <= shape[1]) & (pts[..., 1] <= shape[0])
+
+	# the 6 pairs of the 4 lines, points shared by several pairs are counted once
+	a = np.repeat(np.arange(len(iv)), len(ih)) # index of the v pair
+	b = np.tile(np.arange(len(ih)), len(iv))   # index of the h pair
+	I = np.stack([iv[a], ih[b], iv[a], iv[a], jv[a], jv[a]], axis=1)
+	J = np.stack([jv[a], jh[b], ih[b], jh[b], ih[b], jh[b]], axis=1)
+	poly, found = pts[I, J], ok[I, J]
+	for i, j in itertools.combinations(range(6), 2):
+		found[:, j] &= ~(found[:, i] & np.all(poly[:, i] == poly[:, j], axis=-1))
+	valid = np.count_nonzero(found, axis=1) == 4
+	first = np.argsort(~found, axis=1, kind='stable')[:, :4]
+	poly = np.take_along_axis(poly, first[..., None], axis=1)
+
+	# a line ending on another one is up to the sweep, so ask it
+	for q in np.flatnonzero(end[I, J].any(axis=1)):
+		__poly = laps_intersections([lines[k] for k in (I[q, 0], J[q, 0], I[q, 1], J[q, 1])])
+		__poly = llr_correctness(__poly, shape)
+		valid[q] = len(__poly) == 4
+		if valid[q]: poly[q] = __poly
+
+	# llr_normalize, llr_polysort and cv2.isContourConvex
+	poly = np.trunc(np.where(valid[:, None, None], poly, 0)).astype(int)
+	cen = poly.mean(axis=1, keepdims=True)
+	key = (np.arctan2(poly[..., 0] - cen[..., 0], poly[..., 1] - cen[..., 1]) + 2*math.pi) % (2*math.pi)
+	poly = np.take_along_axis(poly, np.argsort(key, axis=1, kind='stable')[..., None], axis=1)
+	edge = np.roll(poly, -1, axis=1) - poly
+	cross = edge[..., 0] * np.roll(edge, -1, axis=1)[..., 1] - edge[..., 1] * np.roll(edge, -1, axis=1)[..., 0]
+	valid &= np.all(cross > 0, axis=1) | np.all(cross < 0, axis=1)
+
+	return poly[valid], np.flatnonzero(valid)
+
+def llr_best(polys, order, points, centroid, beta, alfa, chunk=64):
+	"""best scored quad, the later one on ties (LLR semantics), pruned by area"""
+	if len(polys) == 0: raise ValueError("no candidate quad")
+	x, y = polys[..., 0], polys[..., 1]
+	area = np.abs((x * np.roll(y, -1, axis=1) - np.roll(x, -1, axis=1) * y).sum(axis=1)) / 2
+
+	# llr_polyscore <= A**4/B**2 with A <= min(len(points), 49)
+	big = area >= (4 * alfa * alfa) * 5
+	bound = np.zeros(len(polys))
+	bound[big] = min(len(points), 49) ** 4 / area[big] ** 2
+
+	# scored in chunks of the best bounds, pruned between the chunks
+	ranked = np.lexsort((-order, -bound))
+	ranked = ranked[big[ranked]]
+	best, best_score = None, 0
+	for start in range(0, len(ranked), chunk):
+		batch = ranked[start:start + chunk]
+		batch = batch[bound[batch] >= best_score]
+		if len(batch) == 0: break
+		scores = llr_polyscores(np.int32(polys[batch]), points, centroid, beta=beta, alfa=alfa)
+		for i, s in zip(batch, scores):
+			if s > best_score or (s == best_score and s > 0 and order[i] > order[best]):
+				best, best_score = i, s
+
+	if best is None: best = int(np.argmax(order)) # all scored 0, the last one is kept
+	return llr_normalize(polys[best]), best_score
+
 ################################################################################
 
 # LAPS, SLID
 
-def LLR(img, points, lines):
+def LLR(img, points, lines, score=False):
 	# print(utils.call("LLR(img, points, lines)"))
 	old = points
 
@@ -181,22 +397,7 @@ def LLR(img, points, lines):
 	pregroup = [[], []]                   # podzial na 2 grupy (dla ramki)
 	S = {}                                # ranking ramek // wraz z wynikiem
 
-	points = llr_correctness(llr_normalize(points), img.shape) # popraw punkty
-
-	# --- clustrowanie
-	import sklearn.cluster
-	__points = {}; points = llr_polysort(points); __max, __points_max = 0, []
-	alfa = math.sqrt(cv2.contourArea(na(points))/49)
-	X = sklearn.cluster.DBSCAN(eps=alfa*4).fit(points) # **(1.3)
-	for i in range(len(points)): __points[i] = []
-	for i in range(len(points)):
-		if X.labels_[i] != -1: __points[X.labels_[i]] += [points[i]]
-	for i in range(len(points)):
-		if len(__points[i]) > __max:
-			__max = len(__points[i]); __points_max = __points[i]
-	if len(__points) > 0 and len(points) > 49/2: points = __points_max
-	# print(X.labels_)
-	# ---
+	points = llr_cluster(points, img.shape) # popraw punkty
 
 	# tworzymy zewnetrzny pierscien
 	ring = __convex_approx(llr_polysort(points))
@@ -266,8 +467,9 @@ def LLR(img, points, lines):
 				tx, ty = l[0][0]-l[1][0], l[0][1]-l[1][1]
 				if abs(tx) < abs(ty): ll, s1, s2 = __v(l); o = 0
 				else:                 ll, s1, s2 = __h(l); o = 1
-				if s1 == 0 and s2 == 0: continue
+				if s1 == 0 and s2 == 0: break
 				pregroup[o] += [ll]
+				break # the same for every other point
 
 	pregroup[0] = llr_unique(pregroup[0])
 	pregroup[1] = llr_unique(pregroup[1])
@@ -296,20 +498,11 @@ def LLR(img, points, lines):
 	# .save("llr_pregroups")
 	
 	# print("---------------------")
-	for v in itertools.combinations(pregroup[0], 2):            # poziome
-		for h in itertools.combinations(pregroup[1], 2):        # pionowe
-			poly = laps_intersections([v[0], v[1], h[0], h[1]]) # przeciecia
-			poly = llr_correctness(poly, img.shape)             # w obrazku
-			if len(poly) != 4: continue                         # jesl. nie ma
-			poly = na(llr_polysort(llr_normalize(poly)))        # sortuj
-			if not cv2.isContourConvex(poly): continue          # wypukly?
-			S[-llr_polyscore(poly, points, centroid, \
-				beta=beta, alfa=alfa/2)] = poly                 # dodaj
-
-	S = collections.OrderedDict(sorted(S.items()))              # max
-	K = next(iter(S))
-	# print("key --", K)
-	four_points = llr_normalize(S[K])               # score
+	# every pair of vertical lines against every pair of horizontal lines,
+	# intersected, filtered and sorted at once, then scored best bound first
+	polys, order = llr_candidates(pregroup[0], pregroup[1], img.shape)
+	four_points, K = llr_best(polys, order, points, centroid, beta, alfa/2)
+	if score: return four_points, K
 
 	# XXX: pomijanie warst, lub ich wybor? (jesli mamy juz okay)
 	# XXX: wycinanie pod sam koniec? (modul wylicznia ile warstw potrzebnych)
@@ -330,12 +523,27 @@ def LLR(img, points, lines):
 
 	return four_points
 
-def llr_pad(four_points, img):
+def llr_quality(score, four_points, points):
+	"""scale free LLR score (1/(C*D) of llr_polyscore, at most 1)"""
+	A = min(len(points), 49)
+	B = cv2.contourArea(na(four_points, dtype=np.float32))
+	if A == 0: return 0
+	return score * (B ** 2) / (A ** 4)
+
+def llr_extrapolate(four_points):
+	"""chessboard corners, one square beyond the inner 7x7 lattice"""
+	src = np.float32(llr_polysort(llr_normalize(four_points)))
+	dst = np.float32([[1, 1], [7, 1], [7, 7], [1, 7]])
+	M = np.linalg.inv(cv2.getPerspectiveTransform(src, dst))
+	pts = np.float32([[0, 0], [8, 0], [8, 8], [0, 8]]).reshape(-1, 1, 2)
+	return cv2.perspectiveTransform(pts, M).reshape(-1, 2).tolist()
+
+def llr_pad(four_points, img, pad=60):
 	# print(utils.call("llr_pad(four_points)"));
 	pco = pyclipper.PyclipperOffset()
 	pco.AddPath(four_points, pyclipper.JT_MITER, pyclipper.ET_CLOSEDPOLYGON)
 	
-	padded = pco.Execute(60)[0]
+	padded = pco.Execute(pad)[0]
 	# debug.image(img) \
 	# 	.points(four_points, color=(0,0,255)) \
 	# 	.points(padded, color=(0,255,0)) \
@@ -347,4 +555,4 @@ def llr_pad(four_points, img):
 	# 			color=(255,255,255)) \
 	# .save("llr_final_pad")
 
-	return pco.Execute(60)[0] # 60,70/75 is best (with buffer/for debug purpose)
+	return pco.Execute(pad)[0] # 60,70/75 is best (with buffer/for debug purpose)
@@ -0,0 +1,49 @@
+from misc.config import *
+from misc.utils import image_order
+
+import cv2, numpy as np
+na = np.array
+
+# board corners (in squares) and the outward diagonal of each marker
+MARKER_CORNERS = na([[0, 0], [8, 0], [8, 8], [0, 8]], dtype=np.float32)
+MARKER_DIRECTIONS = na([[-1, -1], [1, -1], [1, 1], [-1, 1]], dtype=np.float32)
+
+################################################################################
+
+def aruco_detect(img, dictionary):
+	"""ids and corners of the ArUco markers (old and new cv2.aruco API)"""
+	aruco = cv2.aruco
+	if len(np.shape(img)) == 3: img = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+	if hasattr(aruco, 'ArucoDetector'): # OpenCV >= 4.7
+		detector = aruco.ArucoDetector(aruco.getPredefinedDictionary(
+			getattr(aruco, dictionary)), aruco.DetectorParameters())
+		corners, ids, _ = detector.detectMarkers(img)
+	else:
+		corners, ids, _ = aruco.detectMarkers(img, aruco.Dictionary_get(
+			getattr(aruco, dictionary)), parameters=aruco.DetectorParameters_create())
+	if ids is None: return [], []
+	return list(np.ravel(ids)), [na(c).reshape(4, 2) for c in corners]
+
+def marker_points(idx, config):
+	"""positions (in squares) of the 4 corners of the marker at board corner idx"""
+	center = MARKER_CORNERS[idx] + config['marker_offset'] * MARKER_DIRECTIONS[idx]
+	return center + config['marker_size'] / 2 * MARKER_DIRECTIONS # upright markers
+
+def marker_corners(img, config):
+	"""chessboard corners from the corner markers, in image_order (None if too few are visible)"""
+	if not hasattr(cv2, 'aruco'): return None, 0
+	ids, corners = aruco_detect(img, config['markers'])
+
+	src, dst = [], []
+	for marker_id, pts in zip(ids, corners):
+		if marker_id not in config['marker_ids']: continue
+		src += list(marker_points(config['marker_ids'].index(marker_id), config))
+		dst += list(pts)
+
+	found = len(src) // 4
+	if found < config['min_markers']: return None, found
+	H, _ = cv2.findHomography(na(src, dtype=np.float32), na(dst, dtype=np.float32))
+	if H is None: return None, found
+
+	pts = cv2.perspectiveTransform(MARKER_CORNERS.reshape(-1, 1, 2), H)
+	return image_order(pts.reshape(-1, 2)), found
@@ -51,17 +51,18 @@ def slid_canny(img, sigma=0.25):
 	upper = int(min(255, (1.0 + sigma) * v))
 	return cv2.Canny(img, lower, upper)
 
-def slid_detector(img, alfa=150, beta=2):
-	"""detect lines using Hough algorithm"""
+def slid_detector(img, alfa=150, beta=2, scale=1):
+	"""detect lines using Hough algorithm (lengths relative to a 500px image)"""
 	__lines, lines = [], cv2.HoughLinesP(img, rho=1, theta=np.pi/360*beta,
-		threshold=40, minLineLength=50, maxLineGap=15) # [40, 40, 10]
+		threshold=int(40*scale), minLineLength=int(50*scale),
+		maxLineGap=int(15*scale)) # [40, 40, 10]
 	if lines is None: return []
 	for line in np.reshape(lines, (-1, 4)):
 		__lines += [[[int(line[0]), int(line[1])],
 			         [int(line[2]), int(line[3])]]]
 	return __lines
 
-def slid_clahe(img, limit=2, grid=(3,3), iters=5):
+def slid_clahe(img, limit=2, grid=(3,3), iters=5, scale=1):
 	"""repair using CLAHE algorithm (adaptive histogram equalization)"""
 	img = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
 	for i in range(iters):
@@ -69,31 +70,33 @@ def slid_clahe(img, limit=2, grid=(3,3), iters=5):
 				tileGridSize=grid).apply(img)
 	
 	if limit != 0:
-		kernel = np.ones((10, 10), np.uint8)
+		size = max(1, int(10*scale))
+		kernel = np.ones((size, size), np.uint8)
 		img = cv2.morphologyEx(img, cv2.MORPH_CLOSE, kernel)
 		# debug.image(img).save("slid_clahe_@2")
 	return img
 
 ################################################################################
 
-def pSLID(img, thresh=150):
-	"""find all lines using different settings"""
+def pSLID(img, thresh=150, mask=None, scale=1):
+	"""find all lines using different settings (only edges inside mask)"""
 	# print(utils.call("pSLID(img)"))
 	segments = []; i = 0
 	for key, arr in enumerate(NC_SLID_CLAHE):
-		tmp = slid_clahe(img, limit=arr[0], grid=arr[1], iters=arr[2])
-		__segments = list(slid_detector(slid_canny(tmp), thresh))
+		tmp = slid_clahe(img, limit=arr[0], grid=arr[1], iters=arr[2], scale=scale)
+		edges = slid_canny(tmp)
+		if mask is not None: edges = cv2.bitwise_and(edges, mask)
+		__segments = list(slid_detector(edges, thresh, scale=scale))
 		segments += __segments; i += 1
 		# print("FILTER: {} {} : {}".format(i, arr, len(__segments)))
 		# debug.image(slid_canny(tmp)).lines(__segments).save("pslid_F%d" % i)
 	return segments
 
-all_points = []
 def SLID(img, segments):
 	# FIXME: zrobic 2 rodzaje haszowania (katy + pasy [blad - delta])
 	# print(utils.call("SLID(img, segments)"))
 	
-	global all_points; all_points = []
+	all_points = []
 	pregroup, group, hashmap, raw_lines = [[], []], {}, {}, []
 
 	__cache = {}
@@ -147,14 +150,13 @@ def SLID(img, segments):
 		return points
 
 	def __analyze(group):
-		global all_points
 		points = []
 		for idx in group:
 			points += __generate(*hashmap[idx], 10)
 		_, radius = cv2.minEnclosingCircle(na(points)); w = radius * (math.pi/2)
 		vx, vy, cx, cy = cv2.fitLine(na(points), cv2.DIST_L2, 0, 0.01, 0.01)
 		# debug.color()
-		all_points += points
+		all_points.extend(points)
 		return [[int(cx-vx*w), int(cy-vy*w)], [int(cx+vx*w), int(cy+vy*w)]]
 
 	for l in segments:
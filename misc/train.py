@@ -15,7 +15,7 @@ NC_PATH_MODELS = 'data/models/'
 NC_PATH_DATASET = 'data/train/'
 
 NC_MODELS = {
-	'LAPS': {'network': deps.laps.model, 'labels': None},
+	'LAPS': {'network': deps.laps.laps_model(), 'labels': None},
 	'MAIN': {'network': None,            'labels': None}
 }
 
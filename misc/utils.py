@@ -1,12 +1,10 @@
 from misc.config import *
 from time import time
 from copy import copy
-import pickle
 
-import functools, os, re
+import functools, json, os, re
 import sys, cv2, math, numpy as np
 na = np.array
-corners = []
 
 def clock():
 	global NC_CLOCK; return "(%8s)s" % round((time() - NC_CLOCK), 3)
@@ -34,9 +32,15 @@ def image_resize(img, height=500):
 	img_shape = np.shape(img)
 	return img, img_shape, scale
 
-def image_transform(img, points, square_length=150):
-	"""crop original image using perspective warp"""
-	board_length = square_length * 8
+def image_order(points):
+	"""4 points clockwise (in the image), from the one nearest the origin"""
+	pts = na(points, dtype=np.float64).reshape(-1, 2)
+	cen = pts.mean(axis=0)
+	pts = pts[np.argsort(np.arctan2(pts[:, 1] - cen[1], pts[:, 0] - cen[0]))]
+	return np.roll(pts, -int(np.argmin(np.linalg.norm(pts, axis=1))), axis=0).tolist()
+
+def image_homography(points, size):
+	"""perspective matrix mapping 4 points onto a (width, height) rectangle"""
 	def __dis(a, b): return np.linalg.norm(na(a)-na(b))
 	def __shi(seq, n=0): return seq[-(n % len(seq)):] + seq[:-(n % len(seq))]
 	best_idx, best_val = 0, 10**6
@@ -44,25 +48,46 @@ def image_transform(img, points, square_length=150):
 		val = __dis(val, [0, 0])
 		if val < best_val:
 			best_idx, best_val = idx, val
-	pts1 = np.float32(__shi(points, 4 - best_idx))
-	pts2 = np.float32([[0, 0], [board_length, 0], \
-			[board_length, board_length], [0, board_length]])
-	M = cv2.getPerspectiveTransform(pts1, pts2)
-	W = cv2.warpPerspective(img, M, (board_length, board_length))
+	pts1 = np.float32(__shi(list(points), 4 - best_idx))
+	pts2 = np.float32([[0, 0], [size[0], 0], \
+			[size[0], size[1]], [0, size[1]]])
+	return cv2.getPerspectiveTransform(pts1, pts2)
+
+def image_project(pts, M):
+	"""apply perspective matrix to points"""
+	pts = np.float32(pts).reshape(-1, 1, 2)
+	return cv2.perspectiveTransform(pts, M).reshape(-1, 2).tolist()
+
+def image_transform(img, points, square_length=150, size=None):
+	"""crop original image using perspective warp"""
+	board_length = square_length * 8
+	if size is None: size = (board_length, board_length)
+	M = image_homography(points, size)
+	W = cv2.warpPerspective(img, M, tuple(size))
 	return W
 
 class ImageObject(object):
-	images = {}; scale = 1; shape = (0, 0)
+	scale = 1; shape = (0, 0)
 
-	def __init__(self, img):
+	def __init__(self, img, height=500):
 		"""save and prepare image array"""
+		self.images = {} # per instance, images of other detections are not shared
+		self.frame, self.height = img, height
+		main, _, self.scale = image_resize(img, height) # downscale for speed
+		self.transform = np.diag([self.scale, self.scale, 1]) # frame -> main
+		self.load(main)
 		self.images['orig'] = img
-		self.images['main'], self.shape, self.scale = \
-				image_resize(img) # downscale for speed
-		self.images['test'] = copy(self.images['main'])
+
+	def load(self, img):
+		"""prepare image array of the current layer"""
+		self.images['main'], self.shape = img, np.shape(img)
+		self.images['test'] = copy(img)
+		self.images.pop('orig', None) # warped on demand, see __getitem__
 
 	def __getitem__(self, attr):
-		"""return image as array"""
+		"""return image as array ('orig' is the current layer at full resolution)"""
+		if attr == 'orig' and attr not in self.images:
+			self.images['orig'] = self.board()
 		return self.images[attr]
 
 	def __setitem__(self, attr, val):
@@ -70,23 +95,28 @@ class ImageObject(object):
 		self.images[attr] = val
 
 	def crop(self, pts):
-		"""crop using 4 points transform"""
-		pts_orig = image_scale(pts, self.scale)
-		corners.append(pts_orig)	
-		# print("CROPPING: ", pts_orig)
-		# print(self.images['orig'].shape)
-		img_crop = image_transform(self.images['orig'], pts_orig)
-		self.__init__(img_crop)
-
-
-def get_corners():
-	return corners
-	
-def save_corners():
-	os.remove('corners.txt')
-	with open('corners.txt', 'wb') as file:
-		file.truncate(0)
-		pickle.dump(corners, file)
-
-def reset_corners():
-	corners.clear()
\ No newline at end of file
+		"""crop using 4 points transform (warps the original frame once)"""
+		size = (self.height, self.height)
+		M = image_homography(pts, size) # main -> next layer
+		self.points = image_project(pts, np.linalg.inv(self.transform))
+		self.transform = M.dot(self.transform) # frame -> next layer
+		self.load(cv2.warpPerspective(self.frame, self.transform, size))
+
+	def board(self, size=(8 * 150, 8 * 150)):
+		"""current layer warped from the original frame at full resolution"""
+		S = np.diag([size[0] / self.shape[1], size[1] / self.shape[0], 1])
+		return cv2.warpPerspective(self.frame, S.dot(self.transform), tuple(size))
+
+################################################################################
+
+def save_calibration(path, points, M, score=None):
+	"""store the board corners, homography and LLR score of a fixed camera"""
+	with open(path, 'w') as file:
+		json.dump({'corners': na(points).tolist(), 'homography': na(M).tolist(),
+			'score': score}, file)
+
+def load_calibration(path):
+	"""stored board corners, homography and score (None if not calibrated)"""
+	if not os.path.isfile(path): return None
+	with open(path, 'r') as file: data = json.load(file)
+	return data['corners'], na(data['homography']), data.get('score')
@@ -0,0 +1,111 @@
+import sys
+import threading
+import numpy as np
+from config import *
+from inference import load_square_model, load_laps_model
+
+
+class ModelManager:
+
+    def __init__(self, backend=SQUARE_BACKEND, model_loc=None):
+        """
+        backend: Inference backend of the square model, see load_square_model.
+        model_loc: Location of the square model, defaults to the location configured for the backend.
+
+        Loads and warms up the square model and the LAPS model on a background thread, so that
+        neither the start-up nor the first board read pays for it. The manager exposes the same
+        predict method as the square model and can be passed to PerceptionLayer in its place.
+        """
+        self.__lock = threading.Lock()
+        self.__ready = threading.Event()
+        self.__model = None
+        self.error = None
+
+        threading.Thread(target=self.__load, args=(backend, model_loc, True), daemon=True).start()
+
+
+    def __load(self, backend, model_loc, warm_laps=False, on_swap=None):
+        """
+        Description:
+            Loads the square model, runs dummy batches through it at the shapes used during a game
+            and only then makes it the current model. The model being replaced keeps serving
+            predictions until the new one is ready.
+
+        """
+        try:
+            model = load_square_model(backend, model_loc)
+            input_shape = getattr(model, "input_shape", (None, HEIGHT, WIDTH, 3))
+
+            for batch_size in [64, 1]:
+                model.predict(np.zeros((batch_size,) + tuple(input_shape[1:]), dtype=np.float32),
+                              batch_size=batch_size)
+
+            if warm_laps:
+                laps = load_laps_model(LAPS_BACKEND)
+                if laps is None:
+                    from misc.laps import laps_model
+                    laps = laps_model()
+                laps.predict(np.zeros((1, 21, 21, 1), dtype=np.float32))
+
+            with self.__lock:
+                self.__model = model
+
+            if on_swap is not None:
+                on_swap()
+
+            if VERBOSE:
+                print("Square model ready:", backend, model_loc or "")
+
+        except Exception as e:
+            self.error = e
+            sys.stderr.write("Square model could not be loaded: " + str(e) + "\n")
+
+        finally:
+            self.__ready.set()
+
+
+    def get(self):
+        """
+        Description:
+            Returns the current square model, waiting for the initial load to finish if needed.
+
+        """
+        self.__ready.wait()
+
+        with self.__lock:
+            if self.__model is None:
+                raise self.error
+            return self.__model
+
+
+    def is_ready(self):
+        return self.__ready.is_set()
+
+
+    def swap(self, model_loc=None, backend=SQUARE_BACKEND, on_swap=None, wait=False):
+        """
+        Parameters:
+            model_loc: Location of the new square model.
+            backend: Inference backend of the new square model.
+            on_swap: Called once the new model has replaced the current one.
+            wait: Block until the new model is ready.
+
+        Description:
+            Loads and warms up a new square model on a background thread and replaces the current
+            one with it, without interrupting the game. If loading fails, the current model is kept.
+
+        """
+        thread = threading.Thread(target=self.__load, args=(backend, model_loc, False, on_swap), daemon=True)
+        thread.start()
+
+        if wait:
+            thread.join()
+
+
+    @property
+    def input_shape(self):
+        return getattr(self.get(), "input_shape", None)
+
+
+    def predict(self, x, batch_size=None):
+        return self.get().predict(x, batch_size=batch_size)
@@ -1,26 +1,526 @@
 import cv2
 import numpy as np
-import keras
-from keras.applications.xception import preprocess_input
 from utils import *
+from inference import load_square_model, load_laps_model
 from misc import utils
-from misc.utils import ImageObject
+from misc.detector import Detector
 from misc.slid import pSLID, SLID, slid_tendency
 from misc.laps import LAPS
-from misc.llr import LLR, llr_pad
+from misc.llr import LLR
 
-keras.backend.set_learning_phase(0)
 load = cv2.imread
 save = cv2.imwrite
 
 
 class PerceptionLayer:
 
-    def __init__(self, model):
+    def __init__(self, model=None, incremental=False, change_threshold=CHANGE_THRESHOLD,
+                 cascade=False, cascade_thresholds=None, show=True, tier=None, calibration_loc=None,
+                 drift_threshold=DRIFT_THRESHOLD, detector_config=DETECTOR_CONFIG, laps_backend=LAPS_BACKEND):
         """
         model: CNN model that detects whether a chessboard square has a black piece, white piece or is empty.
+        incremental: Only reclassify the squares that have changed since the previous read.
+        change_threshold: Change score above which a square is passed to the CNN model in incremental mode.
+        cascade: Label confidently empty squares from their statistics before falling back to the CNN model.
+        cascade_thresholds: Maximum deviations from the empty square reference, see CASCADE_THRESHOLDS.
+        show: Display the cropped chessboard after every detection.
+        tier: Load the square model of the given MODEL_TIERS tier ("fast", "balanced" or "accurate")
+              instead of passing a model.
+        calibration_loc: File the chessboard corners and homography are loaded from and saved to,
+                         e.g. CALIBRATION_LOC. They are only kept in memory when it is None.
+        drift_threshold: Median displacement of the lattice points, in pixels, above which the
+                         chessboard is considered moved and is detected again.
+        detector_config: Overrides of the board detection settings in NC_CONFIG, e.g.
+                         {"pyramid": True} to detect on a coarse image and refine at native resolution,
+                         or {"markers": "DICT_4X4_50"} to locate the board from ArUco corner markers.
+        laps_backend: "keras" to load the LAPS model from misc/data/models, or "shared" to run it on
+                      the weights packed by weights.py.
         """
+        if tier is not None:
+            model = load_square_model(MODEL_TIERS[tier])
+
         self.model = model
+        self.detector = Detector(detector_config, laps_model=load_laps_model(laps_backend))
+        self.source = None
+        self.corners = None
+        self.homography = None
+        self.lattice = None
+        self.reference_score = None
+        self.tiles = None
+        self.calibration_loc = calibration_loc
+        self.drift_threshold = drift_threshold
+        self.show = show
+        self.incremental = incremental
+        self.change_threshold = change_threshold
+        self.cascade = cascade
+        self.cascade_thresholds = dict(CASCADE_THRESHOLDS, **(cascade_thresholds or {}))
+        self.counters = {"reads": 0, "tiles_classified": 0, "tiles_reused": 0,
+                         "stage1_tiles": 0, "stage1_hits": 0, "stage2_tiles": 0,
+                         "detections": 0, "detection_layers": 0}
+        self.layer_reports = []
+        self.__prev_thumbs = None
+        self.__prev_board_probs = None
+        self.__empty_reference = None
+
+        if calibration_loc is not None:
+            calibration = utils.load_calibration(calibration_loc)
+            if calibration is not None:
+                corners, homography, self.reference_score = calibration
+                self.set_corners(corners, homography)
+
+
+    def get_tile_size(self):
+        """
+        Description:
+            Returns the (height, width) of the squares expected by the CNN model, which defaults to
+            (HEIGHT, WIDTH) when the model does not report its input shape.
+
+        """
+        input_shape = getattr(self.model, "input_shape", None)
+        if input_shape is None:
+            return HEIGHT, WIDTH
+        return int(input_shape[1]), int(input_shape[2])
+
+
+    def extract_tiles(self, image, corners, size=None):
+        """
+        Parameters:
+            image: Image containing the chessboard.
+            corners: The four corners of the chessboard in "image".
+            size: (height, width) of the squares, defaults to get_tile_size.
+
+        Description:
+            Warps the chessboard in "image" straight to an 8*width x 8*height grid, so that every
+            square is already at the input size of the CNN model. The 64 squares are taken as a
+            reshaped view of the grid with the channels reversed to RGB, and the gamma correction and
+            Xception preprocessing are applied in one pass through the lookup table from get_tile_lut.
+
+        Returns:
+            A (64, height, width, 3) float32 array of preprocessed squares in row-order.
+
+        """
+        height, width = size or self.get_tile_size()
+        grid = utils.image_transform(image, corners, size=(8 * width, 8 * height))
+        tiles = grid.reshape((8, height, 8, width, 3))[..., ::-1].swapaxes(1, 2)
+        return get_tile_lut()[tiles].reshape((64, height, width, 3))
+
+
+    def set_corners(self, corners, homography=None, frame=None):
+        """
+        Parameters:
+            corners: The four corners of the chessboard in the camera frame.
+            homography: Matrix mapping the frame onto the board in square units, computed from the
+                        corners when not given.
+            frame: Image the corners were found in, if any.
+
+        Description:
+            Uses the given corners for the following reads, and projects the 7x7 inner lattice points
+            of the board back into the frame for the drift check. When "frame" is given, the lattice
+            points are refined on it with refine_lattice, so that the drift check measures the
+            movement of the board and not the error of the detected corners. Corners loaded from
+            calibration_loc have no frame, and the first drift check is against the projected lattice.
+
+        """
+        self.corners = [list(map(float, pt)) for pt in corners]
+        self.homography = utils.image_homography(self.corners, (8, 8)) if homography is None else homography
+        grid = [[x, y] for y in range(1, 8) for x in range(1, 8)]
+        self.lattice = np.float32(utils.image_project(grid, np.linalg.inv(self.homography)))
+        if frame is not None:
+            self.lattice = self.refine_lattice(frame, self.lattice)
+
+
+    def refine_lattice(self, frame, points):
+        """
+        Parameters:
+            frame: Overhead image of the chessboard.
+            points: (N, 2) lattice points of the chessboard in "frame".
+
+        Description:
+            Refines the lattice points with cornerSubPix, in a window of a quarter of a square
+            around each of them.
+
+        Returns:
+            The refined (N, 2) float32 points.
+
+        """
+        square_length = cv2.arcLength(np.float32(self.corners).reshape((-1, 1, 2)), True) / 32
+        window = max(2, int(square_length / 4))
+
+        grey = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 20, 0.1)
+        start = np.float32(points).reshape((-1, 1, 2)).copy() # cornerSubPix refines in place
+        refined = cv2.cornerSubPix(grey, start, (window, window), (-1, -1), criteria)
+        return refined.reshape((-1, 2))
+
+
+    def get_drift(self, frame):
+        """
+        Parameters:
+            frame: Overhead image of the chessboard.
+
+        Description:
+            Cheap check of whether the chessboard has moved since its corners were found. DRIFT_POINTS
+            of the inner lattice points are refined with refine_lattice around their reference
+            position in "frame". Points hidden by pieces do not move to a corner, so the median
+            displacement is used.
+
+        Returns:
+            The median displacement of the lattice points in pixels.
+
+        """
+        idx = np.linspace(0, len(self.lattice) - 1, DRIFT_POINTS).astype(int)
+        expected = self.lattice[idx]
+        refined = self.refine_lattice(frame, expected)
+
+        return float(np.median(np.linalg.norm(refined - expected, axis=1)))
+
+
+    def locate(self, frame):
+        """
+        Parameters:
+            frame: Overhead image of the chessboard.
+
+        Description:
+            Locates the chessboard in "frame". With a fixed camera, the stored corners are reused as
+            long as the drift check passes. When the board has moved by more than drift_threshold
+            pixels, it is first re-localized around its stored corners, and the slow full detection
+            only runs when that fails or the board has not been located yet.
+
+        """
+        if self.corners is not None:
+            drift = self.get_drift(frame)
+            if drift <= self.drift_threshold:
+                self.source = frame
+                return
+
+            if VERBOSE:
+                print("Chessboard moved by", drift, "pixels, re-localizing it")
+            if self.relocalize(frame):
+                return
+
+        self.calibrate_board(frame)
+
+
+    def get_seeded_corners(self, frame):
+        """
+        Parameters:
+            frame: Overhead image of the chessboard.
+
+        Description:
+            Locates the chessboard near its stored corners. The frame is warped so that the stored
+            board fills a RELOCALIZE_SIZE canvas, inside a RELOCALIZE_MARGIN margin, where a slightly
+            moved board is still almost axis-aligned. pSLID only looks for edges in a band around the
+            expected lines of the board, LAPS only tests the intersections near the expected lattice
+            points and LLR fits the inner lattice, whose corners are then extrapolated to the board
+            corners.
+
+        Returns:
+            The four corners of the chessboard in "frame" and the LLR score of the fit.
+
+        """
+        size, margin = RELOCALIZE_SIZE, RELOCALIZE_MARGIN
+        square_length = (size - 2.0 * margin) / 8
+        band = RELOCALIZE_BAND * square_length
+        M = np.array([[square_length, 0, margin], [0, square_length, margin], [0, 0, 1]]).dot(self.homography)
+        canvas = cv2.warpPerspective(frame, M, (size, size))
+
+        mask = np.zeros((size, size), dtype=np.uint8)
+        for pos in (margin + square_length * np.arange(9)).astype(int):
+            mask[:, max(0, int(pos - band)): int(pos + band) + 1] = 255
+            mask[max(0, int(pos - band)): int(pos + band) + 1, :] = 255
+
+        lines = slid_tendency(SLID(canvas, pSLID(canvas, mask=mask)))
+        seeds = margin + square_length * np.array([[x, y] for y in range(1, 8) for x in range(1, 8)])
+        points = LAPS(canvas, lines, seeds=seeds, radius=band, model=self.detector.laps_model)
+        inner, score = LLR(canvas, points, lines, score=True)
+
+        # Match the corners of the fitted lattice to the expected ones, and extrapolate one square out
+        expected = margin + square_length * np.float32([[1, 1], [7, 1], [7, 7], [1, 7]])
+        inner = np.float32(inner)
+        order = [int(np.argmin(np.linalg.norm(inner - pt, axis=1))) for pt in expected]
+        if len(set(order)) != 4:
+            raise ValueError("The fitted lattice does not match the stored chessboard")
+
+        H = cv2.getPerspectiveTransform(inner[order], expected)
+        outer = margin + square_length * np.float32([[0, 0], [8, 0], [8, 8], [0, 8]])
+        corners = utils.image_project(utils.image_project(outer, np.linalg.inv(H)), np.linalg.inv(M))
+
+        return corners, score
+
+
+    def relocalize(self, frame):
+        """
+        Parameters:
+            frame: Overhead image of the chessboard.
+
+        Description:
+            Re-localizes a slightly moved chessboard with get_seeded_corners. The new corners are only
+            accepted when the LLR score is at least RELOCALIZE_TOLERANCE times the score of the
+            calibration frame.
+
+        Returns:
+            Whether the chessboard was re-localized. If not, a full detection is needed.
+
+        """
+        if self.reference_score is None:
+            return False
+
+        try:
+            corners, score = self.get_seeded_corners(frame)
+        except Exception as e:
+            if VERBOSE:
+                print("Chessboard could not be re-localized:", e)
+            return False
+
+        if score < RELOCALIZE_TOLERANCE * self.reference_score:
+            if VERBOSE:
+                print("Chessboard re-localization rejected, score", score, "of", self.reference_score)
+            return False
+
+        self.source = frame
+        self.set_corners(corners, frame=frame)
+        self.save_calibration()
+        return True
+
+
+    def calibrate_board(self, frame):
+        """
+        Parameters:
+            frame: Overhead image of the chessboard.
+
+        Description:
+            Runs the full detection on "frame" and stores the corners and homography of the
+            chessboard, in calibration_loc when it is set. The LLR score of the seeded search on the
+            same frame is kept as the reference that re-localizations are compared against.
+
+        """
+        self.detect(frame)
+
+        try:
+            self.reference_score = self.get_seeded_corners(frame)[1]
+        except Exception:
+            self.reference_score = None
+
+        self.save_calibration()
+        if LOGGER:
+            log("Chessboard corners calibrated: " + str(self.corners))
+
+
+    def save_calibration(self):
+        if self.calibration_loc is not None:
+            utils.save_calibration(self.calibration_loc, self.corners, self.homography, self.reference_score)
+
+
+    def get_thumbnails(self, tiles):
+        """
+        Parameters:
+            tiles: (64, height, width, 3) array of preprocessed squares from extract_tiles.
+
+        Description:
+            Downscales every square to CHANGE_THUMB_SIZE x CHANGE_THUMB_SIZE by block averaging.
+            The thumbnails are cheap to compare and are used to detect which squares have changed.
+
+        """
+        size = CHANGE_THUMB_SIZE
+        height, width = tiles.shape[1:3]
+        blocks = tiles.reshape((len(tiles), size, height // size, size, width // size, 3))
+        return blocks.mean(axis=(2, 4))
+
+
+    def get_change_scores(self, thumbs):
+        """
+        Parameters:
+            thumbs: Thumbnails of the current squares from get_thumbnails.
+
+        Description:
+            Returns the mean absolute difference between each square's thumbnail and the
+            thumbnail it had when it was last classified.
+
+        """
+        return np.abs(thumbs - self.__prev_thumbs).mean(axis=(1, 2, 3))
+
+
+    def reset_incremental(self):
+        """
+        Description:
+            Forgets the previous read so that the next read in incremental mode classifies all 64 squares.
+
+        """
+        self.__prev_thumbs = None
+        self.__prev_board_probs = None
+
+
+    def get_tile_stats(self, tiles):
+        """
+        Parameters:
+            tiles: (N, height, width, 3) array of preprocessed squares.
+
+        Description:
+            Computes cheap statistics for every square on its central region, away from the
+            square borders: the fraction of strong edges, the grey-level variance and a
+            normalized per-channel colour histogram with CASCADE_BINS bins.
+
+        Returns:
+            A tuple of (N,) edge densities, (N,) variances and (N, 3 * CASCADE_BINS) histograms.
+
+        """
+        height, width = tiles.shape[1:3]
+        margin_y, margin_x = height // 5, width // 5
+        centre = tiles[:, margin_y:height - margin_y, margin_x:width - margin_x]
+        grey = centre.mean(axis=3)
+
+        grad_y = np.abs(np.diff(grey, axis=1))[:, :, :-1]
+        grad_x = np.abs(np.diff(grey, axis=2))[:, :-1, :]
+        edges = ((grad_x + grad_y) > 0.25).mean(axis=(1, 2))
+        variance = grey.var(axis=(1, 2))
+
+        bins = np.clip(((centre + 1) * (CASCADE_BINS / 2)).astype(int), 0, CASCADE_BINS - 1)
+        bins += np.arange(3) * CASCADE_BINS
+        bins = bins.reshape((len(tiles), -1)) + np.arange(len(tiles))[:, None] * 3 * CASCADE_BINS
+        hist = np.bincount(bins.ravel(), minlength=len(tiles) * 3 * CASCADE_BINS)
+        hist = hist.reshape((len(tiles), 3 * CASCADE_BINS)) / float(grey[0].size)
+
+        return edges, variance, hist
+
+
+    def calibrate_empty(self, tiles, board_arr):
+        """
+        Parameters:
+            tiles: (64, height, width, 3) array of preprocessed squares from extract_tiles.
+            board_arr: The 8x8 board array read from the same squares.
+
+        Description:
+            Builds the empty square reference used by the first stage of the cascade. The
+            statistics of the empty squares are averaged separately for light and dark squares,
+            together with their spread, which the cascade thresholds are measured in.
+
+        """
+        empty = np.flatnonzero(np.ravel(board_arr) == -1)
+        edges, variance, hist = self.get_tile_stats(tiles[empty])
+        parity = (empty // 8 + empty % 8) % 2
+        self.__empty_reference = []
+
+        for colour in range(2):
+            idx = parity == colour
+            hist_ref = hist[idx].mean(axis=0)
+            hist_dist = np.abs(hist[idx] - hist_ref).sum(axis=1)
+            self.__empty_reference.append({
+                "edges": (edges[idx].mean(), max(edges[idx].std(), 1e-3)),
+                "variance": (variance[idx].mean(), max(variance[idx].std(), 1e-4)),
+                "histogram": (hist_ref, max(hist_dist.mean() + hist_dist.std(), 1e-2)),
+            })
+
+
+    def get_empty_squares(self, tiles, squares):
+        """
+        Parameters:
+            tiles: (N, height, width, 3) array of preprocessed squares.
+            squares: Indexes (0-63) of the given squares on the board array.
+
+        Description:
+            First stage of the cascade. Compares the statistics of each square with the empty
+            square reference of its colour and returns a boolean mask of the squares which are
+            within all the cascade thresholds, i.e. confidently empty.
+
+        """
+        edges, variance, hist = self.get_tile_stats(tiles)
+        parity = (squares // 8 + squares % 8) % 2
+        confident = np.zeros(len(tiles), dtype=bool)
+
+        for colour in range(2):
+            idx = parity == colour
+            ref = self.__empty_reference[colour]
+            hist_dist = np.abs(hist[idx] - ref["histogram"][0]).sum(axis=1)
+            confident[idx] = (
+                (np.abs(edges[idx] - ref["edges"][0]) / ref["edges"][1] <= self.cascade_thresholds["edges"]) &
+                (np.abs(variance[idx] - ref["variance"][0]) / ref["variance"][1] <= self.cascade_thresholds["variance"]) &
+                (hist_dist / ref["histogram"][1] <= self.cascade_thresholds["histogram"])
+            )
+
+        return confident
+
+
+    def get_stage_rates(self):
+        """
+        Description:
+            Returns the share of the examined squares labelled by the first stage of the cascade
+            and the share that had to be passed to the CNN model.
+
+        """
+        stage1 = max(self.counters["stage1_tiles"], 1)
+        return {"stage1_hit_rate": self.counters["stage1_hits"] / stage1,
+                "stage2_rate": self.counters["stage2_tiles"] / stage1}
+
+
+    def classify_squares(self, tiles, squares):
+        """
+        Parameters:
+            tiles: (N, height, width, 3) array of preprocessed squares.
+            squares: Indexes (0-63) of the given squares on the board array.
+
+        Description:
+            Returns the (N, CLASSES) class probabilities of the given squares. When the cascade is
+            enabled and calibrated, the confidently empty squares are labelled from their statistics
+            and only the remaining ones are passed to the CNN model in a single batch.
+
+        """
+        probs = np.tile(np.eye(CLASSES)[LABELS.index("empty")], (len(tiles), 1))
+        uncertain = np.arange(len(tiles))
+
+        if self.cascade and self.__empty_reference is not None:
+            confident = self.get_empty_squares(tiles, squares)
+            uncertain = np.flatnonzero(~confident)
+            self.counters["stage1_tiles"] += len(tiles)
+            self.counters["stage1_hits"] += int(confident.sum())
+            self.counters["stage2_tiles"] += len(uncertain)
+
+        if len(uncertain) > 0:
+            probs[uncertain] = self.model.predict(tiles[uncertain], batch_size=len(uncertain))
+
+        return probs
+
+
+    def classify_tiles(self, tiles):
+        """
+        Parameters:
+            tiles: (64, height, width, 3) array of preprocessed squares from extract_tiles.
+
+        Description:
+            Classifies the squares and returns their probabilities as an 8x8xCLASSES array. In
+            incremental mode, only the squares whose change score exceeds change_threshold are
+            classified and the probabilities from the previous read are reused for the rest. The
+            counters record how many squares were classified and reused.
+
+        """
+        self.tiles = tiles
+        thumbs = None
+
+        if self.incremental and self.__prev_thumbs is not None:
+            thumbs = self.get_thumbnails(tiles)
+            changed = np.flatnonzero(self.get_change_scores(thumbs) > self.change_threshold)
+            board_probs = self.__prev_board_probs.copy()
+        else:
+            changed = np.arange(len(tiles))
+            board_probs = np.zeros((64, CLASSES))
+
+        if len(changed) > 0:
+            board_probs[changed] = self.classify_squares(tiles[changed], changed)
+
+        if self.incremental:
+            if thumbs is None:
+                self.__prev_thumbs = self.get_thumbnails(tiles)
+            else:
+                self.__prev_thumbs[changed] = thumbs[changed]
+            self.__prev_board_probs = board_probs.copy()
+
+            if VERBOSE:
+                print("Squares reclassified: ", len(changed))
+
+        self.counters["reads"] += 1
+        self.counters["tiles_classified"] += len(changed)
+        self.counters["tiles_reused"] += len(tiles) - len(changed)
+
+        return board_probs.reshape((8, 8, CLASSES))
 
 
     def generate_board(self, board):
@@ -29,32 +529,57 @@ class PerceptionLayer:
             board: A cropped overhead image of a chessboard.
 
         Description:
-            Takes the chessboard image "board" and cuts into 64 squares. Each square is then passed
-            to the CNN model and its output is used to construct a 8x8 array that represents the chessboard
-            in "board" picture.
+            Takes the chessboard image "board" and cuts into 64 squares. The squares are stacked into
+            a single (64, height, width, 3) batch and passed to the CNN model in one forward pass. Its
+            output is used to construct a 8x8 array that represents the chessboard in "board" picture.
+
+        """
+        height, width = board.shape[:2]
+        corners = [[0, 0], [width, 0], [width, height], [0, height]]
+        board_probs = self.classify_tiles(self.extract_tiles(board, corners))
+        return get_board_arr(board_probs.reshape((64, CLASSES)), LABELS)
+
+
+    def generate_board_probs(self, frame):
+        """
+        Parameters:
+            frame: Overhead image of a chessboard.
+
+        Description:
+            Returns a 8x8xCLASSES array with the class probabilities of every square of the
+            chessboard in "frame". First, the locate function finds the chessboard corners in
+            "frame", reusing the stored ones unless the board has moved. The squares are then
+            warped directly from the frame, and classified.
 
         """
-        side_len = int(board.shape[0] / 8)
-        dim = (WIDTH, HEIGHT)
-        board_arr = np.zeros((8, 8))
+        self.locate(frame)
+        return self.classify_tiles(self.extract_tiles(self.source, self.corners))
 
-        for i in range(8):
-            for j in range(8):
-                tile = board[i * side_len: (i + 1) * side_len, j * side_len: (j + 1) * side_len]
-                tile = cv2.resize(tile, dim)
-                tile = cv2.cvtColor(tile, cv2.COLOR_BGR2RGB)
-                tile = adjust_gamma(tile)
-                tile = np.expand_dims(np.array(tile), axis=0)
-                tile = preprocess_input(tile)
 
-                pred = get_pred(self.model.predict(tile)[0], LABELS)
+    def generate_board_probs_frames(self, frames, method=VOTE_METHOD):
+        """
+        Parameters:
+            frames: Consecutive overhead images of the same chessboard position.
+            method: "mean" averages the probabilities of the frames, "vote" uses the share of frames
+                    in which each class was the most likely one.
 
-                if pred == "empty":
-                    board_arr[i, j] = -1
-                elif pred == "w":
-                    board_arr[i, j] = 1
+        Description:
+            Multi-frame version of generate_board_probs. The chessboard is located in the first
+            frame and the same corners are used to extract the squares of every frame. All the
+            squares are classified in a single batch and combined per square, which smooths out
+            glare and noise for about the cost of one read.
 
-        return board_arr
+        """
+        self.locate(frames[0])
+        tiles = np.concatenate([self.extract_tiles(frame, self.corners) for frame in frames])
+        squares = np.tile(np.arange(64), len(frames))
+        probs = self.classify_squares(tiles, squares).reshape((len(frames), 64, CLASSES))
+
+        if method == "vote":
+            probs = np.eye(CLASSES)[probs.argmax(axis=2)]
+
+        self.tiles = tiles[:64]
+        return probs.mean(axis=0).reshape((8, 8, CLASSES))
 
 
     def generate_board_arr(self, frame):
@@ -63,44 +588,84 @@ class PerceptionLayer:
             frame: Overhead image of a chessboard.
 
         Description:
-            Returns a 8x8 array that represents the chessboard image passed as "frame". First,
-            the detect function crops "frame" and extracts only the chessboard from the picture,
-            removing everything else. The generate board function then takes the cropped image
-            and returns its corresponding array.
+            Returns a 8x8 array that represents the chessboard image passed as "frame", built
+            from the most likely class of every square returned by generate_board_probs.
 
         """
-        warped = self.detect(frame)
-        return self.generate_board(warped)
+        board_probs = self.generate_board_probs(frame)
+        return get_board_arr(board_probs.reshape((64, CLASSES)), LABELS)
 
 
-    def layer(self):
-        global NC_LAYER, NC_IMAGE
+    def verify_squares(self, frames, expected, method=VOTE_METHOD):
+        """
+        Parameters:
+            frames: Consecutive overhead images of the chessboard taken after the robot's move.
+            expected: Dictionary mapping (row, col) indexes of the board array to their expected
+                      value, as returned by ApplicationLayer.get_move_squares().
+            method: How the frames are combined, see generate_board_probs_frames.
 
-        segments = pSLID(NC_IMAGE['main'])
-        raw_lines = SLID(NC_IMAGE['main'], segments)
-        lines = slid_tendency(raw_lines)
-        points = LAPS(NC_IMAGE['main'], lines)
-        inner_points = LLR(NC_IMAGE['main'], points, lines)
-        four_points = llr_pad(inner_points, NC_IMAGE['main'])
+        Description:
+            Checks that the robot has placed the pieces correctly by classifying only the squares
+            affected by its move, in every frame, in one small batch. The stored chessboard corners
+            are reused, so no detection is run unless the board has moved.
 
-        try:
-            NC_IMAGE.crop(four_points)
-            save(str(NC_LAYER) + ".png", NC_IMAGE['orig'])
+        Returns:
+            A list of (row, col, expected, detected) tuples for every square that does not match.
 
-        except:
-            utils.warn("Next layer is not needed")
-            NC_IMAGE.crop(inner_points)
+        """
+        self.locate(frames[0])
+
+        coords = sorted(expected.keys())
+        squares = np.array([8 * row + col for row, col in coords])
+        tiles = np.concatenate([self.extract_tiles(frame, self.corners)[squares] for frame in frames])
+        probs = self.classify_squares(tiles, np.tile(squares, len(frames))).reshape((len(frames), len(squares), CLASSES))
+
+        if method == "vote":
+            probs = np.eye(CLASSES)[probs.argmax(axis=2)]
+
+        values = get_square_values(probs.mean(axis=0), LABELS)
 
-        print("\n")
+        mismatches = []
+        for (row, col), value in zip(coords, values):
+            if value != expected[(row, col)]:
+                mismatches.append((row, col, expected[(row, col)], int(value)))
+
+        if VERBOSE:
+            print("Move verification mismatches: ", mismatches)
+        if LOGGER:
+            log("Move verification mismatches: " + str(mismatches))
+
+        return mismatches
 
 
     def detect(self, image):
-        global NC_LAYER, NC_IMAGE, NC_CONFIG
+        """
+        Parameters:
+            image: Overhead image of a chessboard.
+
+        Description:
+            Runs the full board detection on "image" and uses the corners it finds for the following
+            reads. The detection keeps no global state, so separate PerceptionLayers, or detectors,
+            can locate boards concurrently in threads or processes. The detector stops as soon as a
+            layer converges. The per-layer decisions are kept in layer_reports and the number of
+            layers run is counted.
+
+        Returns:
+            The cropped chessboard.
+
+        """
+        self.layer_reports = []
+        corners, board = self.detector.detect(image, self.layer_reports)
+        self.counters["detections"] += 1
+        self.counters["detection_layers"] += sum(report["layer"] > 0 for report in self.layer_reports)
 
-        NC_IMAGE, NC_LAYER = ImageObject(image), 0
-        for _ in range(NC_CONFIG['layers']):
-            NC_LAYER += 1
-            self.layer()
+        if VERBOSE:
+            print("Detection layers: ", self.layer_reports)
+        if LOGGER:
+            log("Detection layers: " + str(self.layer_reports))
 
-        show_img(NC_IMAGE['orig'])
-        return NC_IMAGE['orig']
+        self.source = image
+        self.set_corners(corners, frame=image)
+        if self.show:
+            show_img(board)
+        return board
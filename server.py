@@ -0,0 +1,260 @@
+from threads import configure_threads
+import argparse
+import json
+import os
+import queue
+import socket
+import socketserver
+import struct
+import threading
+import numpy as np
+from utils import *
+
+
+def send_message(sock, header, payload=b""):
+    """
+    Description:
+        Sends a message made of a JSON header and an optional binary payload. Both are prefixed
+        with their length as a 4-byte big-endian integer.
+
+    """
+    header = json.dumps(header).encode("utf-8")
+    sock.sendall(struct.pack(">II", len(header), len(payload)) + header + payload)
+
+
+def recv_exactly(sock, size):
+    data = bytearray(size)
+    view = memoryview(data)
+    received = 0
+
+    while received < size:
+        count = sock.recv_into(view[received:], size - received)
+        if count == 0:
+            raise ConnectionError("Connection closed")
+        received += count
+
+    return data
+
+
+def recv_message(sock):
+    """
+    Description:
+        Receives a message sent with send_message and returns its header and payload.
+
+    """
+    header_len, payload_len = struct.unpack(">II", recv_exactly(sock, 8))
+    header = json.loads(recv_exactly(sock, header_len).decode("utf-8"))
+    return header, recv_exactly(sock, payload_len)
+
+
+class PerceptionServer:
+
+    def __init__(self, address=PERCEPTION_ADDRESS, batch_window=BATCH_WINDOW, max_batch=BATCH_MAX_FRAMES):
+        """
+        address: Path of a Unix domain socket, or a (host, port) tuple for TCP on localhost.
+        batch_window: Seconds to wait for more requests after the first one before running a batch.
+        max_batch: Maximum number of frames classified in a single batch.
+
+        Keeps the square model, the LAPS model and a PerceptionLayer resident and serves board
+        reads over a local socket. Requests that arrive within batch_window of each other are
+        classified together in a single predict call. Every connection locates its chessboard with
+        its own PerceptionLayer, see create_session.
+        """
+        from models import ModelManager
+        from perception import PerceptionLayer
+
+        self.address = address
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self.percept = PerceptionLayer(ModelManager(), show=False)
+        self.__requests = queue.Queue()
+
+
+    def create_session(self):
+        """
+        Description:
+            Returns a PerceptionLayer for a single connection. It shares the models of the server but
+            keeps its own chessboard location, so that a client locating its board does not
+            overwrite the corners of the other clients.
+
+        """
+        from perception import PerceptionLayer
+        return PerceptionLayer(self.percept.model, show=False)
+
+
+    def __run_batch(self, batch):
+        """
+        Description:
+            Locates the chessboard in every frame of the batch with the PerceptionLayer of its
+            request, unless the client sent its corners, and classifies the squares of all the
+            frames in one call.
+
+        """
+        tiles, done = [], []
+
+        for request in batch:
+            try:
+                frame, corners, percept = request["frame"], request["corners"], request["percept"]
+                if corners is None:
+                    percept.locate(frame)
+                    corners = percept.corners
+
+                tiles.append(self.percept.extract_tiles(frame, corners))
+                request["result"] = {"corners": [list(map(float, pt)) for pt in corners]}
+                done.append(request)
+
+            except Exception as e:
+                request["result"] = {"error": str(e)}
+                request["event"].set()
+
+        if len(done) > 0:
+            try:
+                squares = np.tile(np.arange(64), len(done))
+                probs = self.percept.classify_squares(np.concatenate(tiles), squares)
+
+                for i, request in enumerate(done):
+                    board_probs = probs[64 * i: 64 * (i + 1)]
+                    request["result"]["board_probs"] = board_probs.reshape((8, 8, CLASSES)).tolist()
+                    request["result"]["board_arr"] = get_board_arr(board_probs, LABELS).tolist()
+
+            except Exception as e:
+                for request in done:
+                    request["result"] = {"error": str(e)}
+
+        for request in done:
+            request["event"].set()
+
+
+    def __batch_loop(self):
+        while True:
+            batch = [self.__requests.get()]
+
+            try:
+                while len(batch) < self.max_batch:
+                    batch.append(self.__requests.get(timeout=self.batch_window))
+            except queue.Empty:
+                pass
+
+            self.__run_batch(batch)
+
+
+    def read(self, frame, corners=None, percept=None):
+        """
+        Parameters:
+            frame: Overhead image of a chessboard.
+            corners: Corners of the chessboard in "frame", it is located when they are not given.
+            percept: PerceptionLayer of the connection, from create_session. Defaults to the
+                     PerceptionLayer of the server.
+
+        Description:
+            Queues a frame for the next batch and waits for its result.
+
+        """
+        request = {"frame": frame, "corners": corners, "percept": percept or self.percept,
+                   "event": threading.Event(), "result": None}
+        self.__requests.put(request)
+        request["event"].wait()
+        return request["result"]
+
+
+    def serve_forever(self):
+        server = self
+
+        class Handler(socketserver.BaseRequestHandler):
+            def handle(self):
+                percept = server.create_session()
+
+                while True:
+                    try:
+                        header, payload = recv_message(self.request)
+                    except ConnectionError:
+                        return
+
+                    frame = np.frombuffer(payload, dtype=header["dtype"]).reshape(header["shape"])
+                    send_message(self.request, server.read(frame, header.get("corners"), percept))
+
+        if isinstance(self.address, str):
+            if os.path.exists(self.address):
+                os.remove(self.address)
+            socket_server = socketserver.ThreadingUnixStreamServer(self.address, Handler)
+        else:
+            socket_server = socketserver.ThreadingTCPServer(tuple(self.address), Handler)
+
+        socket_server.daemon_threads = True
+        threading.Thread(target=self.__batch_loop, daemon=True).start()
+        print("Perception server listening on", self.address)
+        socket_server.serve_forever()
+
+
+class PerceptionClient:
+
+    def __init__(self, address=PERCEPTION_ADDRESS):
+        """
+        address: Address of a running PerceptionServer.
+
+        Reads boards through a PerceptionServer. It does not import Keras, so creating it is
+        instant. The corners of the last read are kept in self.corners.
+        """
+        if isinstance(address, str):
+            self.__sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        else:
+            self.__sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            address = tuple(address)
+
+        self.__sock.connect(address)
+        self.corners = None
+
+
+    def read(self, frame, corners=None):
+        """
+        Parameters:
+            frame: Overhead image of a chessboard.
+            corners: Corners of the chessboard in "frame". The server locates the chessboard when
+                     they are not given.
+
+        Returns:
+            A dictionary with the "board_arr", "board_probs" and "corners" of the frame.
+
+        """
+        frame = np.ascontiguousarray(frame)
+        header = {"shape": list(frame.shape), "dtype": str(frame.dtype), "corners": corners}
+        send_message(self.__sock, header, frame.tobytes())
+        result, _ = recv_message(self.__sock)
+
+        if "error" in result:
+            raise RuntimeError("Perception server error: " + result["error"])
+
+        self.corners = result["corners"]
+        return result
+
+
+    def generate_board_arr(self, frame):
+        return np.array(self.read(frame)["board_arr"])
+
+
+    def generate_board_probs(self, frame):
+        return np.array(self.read(frame)["board_probs"])
+
+
+    def close(self):
+        self.__sock.close()
+
+
+if __name__ == "__main__":
+    p = argparse.ArgumentParser(description='Keep the perception models resident and serve board reads.')
+
+    p.add_argument('--unix', type=str,
+                   help='path of a Unix domain socket to listen on instead of PERCEPTION_ADDRESS')
+    p.add_argument('--port', type=int,
+                   help='localhost TCP port to listen on instead of PERCEPTION_ADDRESS')
+
+    args = p.parse_args()
+    address = PERCEPTION_ADDRESS
+
+    if args.unix:
+        address = args.unix
+    elif args.port:
+        address = ("127.0.0.1", args.port)
+
+    configure_threads(role="worker", tensorflow=True)
+    PerceptionServer(address).serve_forever()
@@ -0,0 +1,83 @@
+import os
+import cv2
+import numpy as np
+import pytest
+
+from misc.detector import Detector
+
+SAMPLE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "misc", "test", "in", "1.jpg")
+CORNERS = [[200, 120], [740, 140], [720, 640], [230, 620]]
+
+
+def chessboard(corners, size=(960, 720)):
+    """
+    Description:
+        Synthetic 8x8 chessboard of 100px squares, warped onto the four corners of a grey frame.
+
+    """
+    board = np.uint8(np.kron(np.indices((8, 8)).sum(axis=0) % 2, np.ones((100, 100))) * 255)
+    M = cv2.getPerspectiveTransform(np.float32([[0, 0], [800, 0], [800, 800], [0, 800]]), np.float32(corners))
+    frame = cv2.warpPerspective(board, M, size, borderValue=128)
+    return cv2.cvtColor(frame, cv2.COLOR_GRAY2BGR)
+
+
+def marker_chessboard(corners, size=(960, 760), square=60):
+    """
+    Description:
+        Synthetic chessboard with the DICT_4X4_50 markers 0-3 at its TL, TR, BR, BL corners (as in
+        NC_CONFIG), warped onto the four corners of a grey frame.
+
+    """
+    aruco = cv2.aruco
+    dictionary = aruco.getPredefinedDictionary(aruco.DICT_4X4_50)
+    generate = getattr(aruco, "generateImageMarker", None) or aruco.drawMarker
+
+    board = np.full((12 * square, 12 * square), 255, dtype=np.uint8) # 2 squares of margin
+    board[2 * square:10 * square, 2 * square:10 * square] = np.kron(np.indices((8, 8)).sum(axis=0) % 2,
+                                                                    np.ones((square, square))) * 255
+    for marker_id, (x, y) in enumerate([[-0.75, -0.75], [8.75, -0.75], [8.75, 8.75], [-0.75, 8.75]]):
+        x, y = int((x + 1.5) * square), int((y + 1.5) * square)
+        board[y:y + square, x:x + square] = generate(dictionary, marker_id, square)
+
+    src = np.float32([[2, 2], [10, 2], [10, 10], [2, 10]]) * square
+    M = cv2.getPerspectiveTransform(src, np.float32(corners))
+    frame = cv2.warpPerspective(board, M, size, borderValue=200)
+    return cv2.cvtColor(frame, cv2.COLOR_GRAY2BGR)
+
+
+def test_refine():
+    rough = np.float32(CORNERS) + [[4, -3], [-3, 4], [5, 2], [-2, -5]]
+    refined = Detector().refine(chessboard(CORNERS), rough.tolist())
+    np.testing.assert_allclose(refined, CORNERS, atol=1.0)
+
+
+def test_layers_orientation():
+    image = cv2.imread(SAMPLE)
+    runs = [Detector({"layers": n, "min_layers": n}).detect(image) for n in (1, 2, 3)]
+    corners, board = np.float32(runs[0][0]), np.float32(runs[0][1])
+    for other_corners, other_board in runs[1:]:
+        dist = np.linalg.norm(corners[:, None] - np.float32(other_corners)[None], axis=2)
+        assert dist.argmin(axis=1).tolist() == [0, 1, 2, 3]
+        other_board = np.float32(other_board)
+        assert np.abs(other_board - board).mean() < np.abs(other_board - board.transpose(1, 0, 2)).mean()
+
+
+@pytest.mark.skipif(not hasattr(cv2, "aruco"), reason="needs opencv-contrib")
+def test_markers_orientation():
+    # the board is turned by a quarter, its TL marker is at the top right of the frame
+    image = marker_chessboard([[760, 130], [740, 620], [230, 600], [210, 150]])
+    markers = Detector({"markers": "DICT_4X4_50"}).detect(image)
+    lattice = Detector().detect(image)
+    dist = np.linalg.norm(np.float32(markers[0])[:, None] - np.float32(lattice[0])[None], axis=2)
+    assert dist.argmin(axis=1).tolist() == [0, 1, 2, 3]
+    assert dist.min(axis=1).max() < 10
+
+
+def test_lattice_span():
+    from misc.lattice import lattice_span
+    s, e = lattice_span(np.float32([-1, 0, 0, 1, 2, 3, 4, 5, 6, 6, 8]))
+    assert (s, e) == (0, 6)
+    assert lattice_span(np.arange(0, 7)) == (0, 6)
+    # a partial lattice has no inner 7x7 quad, the detector falls back to LLR
+    with pytest.raises(ValueError):
+        lattice_span(np.arange(0, 5))
@@ -0,0 +1,123 @@
+import collections
+import glob
+import itertools
+import os
+import cv2
+import numpy as np
+import pytest
+
+import misc.llr
+from misc.llr import llr_best, llr_candidates, llr_correctness, llr_normalize, llr_polyscore, llr_polyscores, llr_polysort
+from misc.laps import laps_intersections
+
+SAMPLES = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "misc", "test", "in", "*.jpg")
+
+
+def naive_candidates(vs, hs, shape):
+    """
+    Description:
+        The quads of LLR before the vectorized search: every pair of vertical lines against every pair
+        of horizontal lines, intersected by the sweep line. Returns (index of the quad, quad) pairs.
+
+    """
+    candidates = []
+    for k, (v, h) in enumerate(itertools.product(itertools.combinations(vs, 2), itertools.combinations(hs, 2))):
+        poly = laps_intersections([v[0], v[1], h[0], h[1]])
+        poly = llr_correctness(poly, shape)
+        if len(poly) != 4:
+            continue
+        poly = np.array(llr_polysort(llr_normalize(poly)))
+        if not cv2.isContourConvex(poly):
+            continue
+        candidates.append((k, poly))
+    return candidates
+
+
+def naive_best(vs, hs, points, centroid, beta, alfa, shape):
+    """
+    Description:
+        The best quad of LLR before the vectorized search, every candidate scored by llr_polyscore.
+
+    """
+    S = {}
+    for _, poly in naive_candidates(vs, hs, shape):
+        S[-llr_polyscore(poly, points, centroid, beta=beta, alfa=alfa)] = poly
+    S = collections.OrderedDict(sorted(S.items()))
+    K = next(iter(S))
+    return llr_normalize(S[K]), -K
+
+
+@pytest.fixture(scope="module")
+def searches():
+    """
+    Description:
+        Runs LLR on the sample images and records the arguments of its candidate search.
+
+    """
+    from misc.utils import ImageObject
+    from misc.slid import pSLID, SLID, slid_tendency
+    from misc.laps import LAPS
+
+    calls, searches = {}, []
+    candidates, best = misc.llr.llr_candidates, misc.llr.llr_best
+
+    def spy_candidates(vs, hs, shape):
+        calls["lines"] = (vs, hs, shape)
+        return candidates(vs, hs, shape)
+
+    def spy_best(polys, order, points, centroid, beta, alfa):
+        calls["best"] = (points, centroid, beta, alfa)
+        return best(polys, order, points, centroid, beta, alfa)
+
+    with pytest.MonkeyPatch.context() as patch:
+        patch.setattr(misc.llr, "llr_candidates", spy_candidates)
+        patch.setattr(misc.llr, "llr_best", spy_best)
+        for image_loc in sorted(glob.glob(SAMPLES)):
+            main = ImageObject(cv2.imread(image_loc))['main']
+            lines = slid_tendency(SLID(main, pSLID(main)))
+            points = LAPS(main, lines)
+            calls.clear()
+            misc.llr.LLR(main, points, lines)
+            searches.append(calls["lines"] + calls["best"])
+
+    assert len(searches) > 0
+    return searches
+
+
+def test_candidates_match_sweep(searches):
+    for vs, hs, shape, *_ in searches:
+        polys, order = llr_candidates(vs, hs, shape)
+        expected = naive_candidates(vs, hs, shape)
+        assert list(order) == [k for k, _ in expected]
+        for poly, (_, expected_poly) in zip(polys, expected):
+            np.testing.assert_array_equal(poly, expected_poly)
+
+
+def test_candidates_segment_endings():
+    # the second horizontal line starts on the first vertical one, the sweep line does not report it
+    vs = [[[255, 112], [376, 528]], [[0, 18], [0, 451]]]
+    hs = [[[670, 471], [-12, 337]], [[0, 190], [640, 178]], [[631, 349], [253, 466]]]
+    polys, order = llr_candidates(vs, hs, (480, 640, 3))
+    expected = naive_candidates(vs, hs, (480, 640, 3))
+    assert list(order) == [k for k, _ in expected]
+    for poly, (_, expected_poly) in zip(polys, expected):
+        np.testing.assert_array_equal(poly, expected_poly)
+
+
+def test_best_matches_naive(searches):
+    for vs, hs, shape, points, centroid, beta, alfa in searches:
+        polys, order = llr_candidates(vs, hs, shape)
+        four_points, score = llr_best(polys, order, points, centroid, beta, alfa)
+        assert (four_points, score) == naive_best(vs, hs, points, centroid, beta, alfa, shape)
+
+
+def test_polyscores_match_polyscore(searches):
+    for vs, hs, shape, points, centroid, beta, alfa in searches:
+        polys, _ = llr_candidates(vs, hs, shape)
+        scores = llr_polyscores(np.int32(polys), points, centroid, beta=beta, alfa=alfa)
+        assert scores.tolist() == [llr_polyscore(poly, points, centroid, beta=beta, alfa=alfa) for poly in np.int32(polys)]
+
+
+def test_best_without_candidates():
+    with pytest.raises(ValueError):
+        llr_best(np.zeros((0, 4, 2), dtype=int), np.zeros(0, dtype=int), [[0, 0]], (0, 0), 2, 5)
@@ -0,0 +1,57 @@
+import os
+import subprocess
+import sys
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_import_without_keras():
+    # Keras is only imported by the loaders of the keras backend, see inference.import_keras
+    code = "import perception, sys; print('keras' in sys.modules or 'tensorflow' in sys.modules)"
+    result = subprocess.run([sys.executable, "-c", code], cwd=ROOT, stdout=subprocess.PIPE, check=True)
+    assert result.stdout.split()[-1] == b"False"
+
+
+def test_locate_reuses_calibration(monkeypatch):
+    from perception import PerceptionLayer
+    from test_detector import CORNERS, chessboard
+
+    frame = chessboard(CORNERS)
+    percept = PerceptionLayer(None, show=False)
+    percept.calibrate_board(frame)
+
+    def fail(frame):
+        raise AssertionError("the stored corners were not reused")
+
+    monkeypatch.setattr(percept, "relocalize", fail)
+    monkeypatch.setattr(percept, "calibrate_board", fail)
+    percept.locate(frame.copy())
+    assert percept.counters["detections"] == 1
+
+
+def test_drift_of_moved_board():
+    from perception import PerceptionLayer
+    from test_detector import CORNERS, chessboard
+    from config import DRIFT_THRESHOLD
+
+    percept = PerceptionLayer(None, show=False)
+    percept.calibrate_board(chessboard(CORNERS))
+    assert percept.get_drift(chessboard(np.float32(CORNERS) + [6, 4])) > DRIFT_THRESHOLD
+
+
+def test_verify_squares_frames():
+    from perception import PerceptionLayer
+    from test_detector import CORNERS, chessboard
+    from config import CLASSES, LABELS
+
+    class EmptyModel:
+        def predict(self, tiles, batch_size=None):
+            return np.tile(np.eye(CLASSES)[LABELS.index("empty")], (len(tiles), 1))
+
+    frame = chessboard(CORNERS)
+    percept = PerceptionLayer(EmptyModel(), show=False)
+    percept.calibrate_board(frame)
+    assert percept.verify_squares([frame] * 3, {(6, 4): -1, (4, 4): -1}) == []
+    assert percept.verify_squares([frame] * 3, {(6, 4): -1, (4, 4): 1}) == [(4, 4, 1, -1)]
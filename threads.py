@@ -0,0 +1,74 @@
+# Import this module before NumPy, SciPy or OpenCV, since the BLAS libraries
+# only read their thread counts when they are loaded.
+import os
+import sys
+from config import THREAD_BUDGET, CPU_AFFINITY
+
+BLAS_ENV_VARS = ["OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS",
+                 "VECLIB_MAXIMUM_THREADS", "NUMEXPR_NUM_THREADS"]
+
+
+def get_blas_env(budget=THREAD_BUDGET):
+    """
+    Description:
+        Returns the environment variables that limit the BLAS and OpenMP thread pools.
+
+    """
+    return {name: str(budget["blas"]) for name in BLAS_ENV_VARS}
+
+
+def configure_threads(budget=THREAD_BUDGET, role="main", tensorflow=False):
+    """
+    Parameters:
+        budget: Thread counts for "opencv", "tensorflow_intra", "tensorflow_inter" and "blas".
+        role: Key of CPU_AFFINITY with the CPUs the calling process is pinned to.
+        tensorflow: Configure TensorFlow as well, which imports it.
+
+    Description:
+        Assigns the thread counts to OpenCV, TensorFlow and the BLAS libraries used by NumPy,
+        SciPy and scikit-learn, so that they do not oversubscribe the CPU, and pins the process
+        to its CPUs. TensorFlow only accepts its thread counts before it is first used.
+
+    """
+    os.environ.update(get_blas_env(budget))
+
+    import cv2
+    cv2.setNumThreads(budget["opencv"])
+
+    try:
+        from threadpoolctl import threadpool_limits
+        threadpool_limits(budget["blas"])
+    except ImportError:  # the BLAS environment variables above still apply to subprocesses
+        sys.stderr.write("BLAS thread budget not applied in this process: install threadpoolctl\n")
+
+    if tensorflow:
+        import tensorflow as tf
+        try:
+            tf.config.threading.set_intra_op_parallelism_threads(budget["tensorflow_intra"])
+            tf.config.threading.set_inter_op_parallelism_threads(budget["tensorflow_inter"])
+        except RuntimeError as e:
+            sys.stderr.write("TensorFlow thread budget not applied: " + str(e) + "\n")
+
+    cpus = CPU_AFFINITY.get(role)
+    if cpus:
+        set_affinity(cpus)
+
+
+def set_affinity(cpus):
+    """
+    Description:
+        Pins the calling process to the given CPUs. psutil supports Windows and Linux, without it
+        only os.sched_setaffinity (Linux) is available.
+
+    """
+    try:
+        import psutil
+        psutil.Process().cpu_affinity(list(cpus))
+    except (ImportError, AttributeError):  # psutil has no cpu_affinity on macOS
+        if hasattr(os, "sched_setaffinity"):
+            os.sched_setaffinity(0, cpus)
+        else:
+            sys.stderr.write("CPU affinity not applied: install psutil to pin the process on this platform\n")
+
+
+os.environ.update(get_blas_env())
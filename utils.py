@@ -1,5 +1,6 @@
 from chess import RANK_NAMES
 from chess import square
+from functools import lru_cache
 import cv2
 import numpy as np
 from config import *
@@ -10,12 +11,30 @@ def log(data):
         File.write("\n" + data)
 
 
-def adjust_gamma(image, gamma=1.5):
+@lru_cache(maxsize=None)
+def get_gamma_table(gamma=1.5):
     invGamma = 1.0 / gamma
-    table = np.array([((i / 255.0) ** invGamma) * 255
-                      for i in np.arange(0, 256)]).astype("uint8")
+    return (((np.arange(0, 256) / 255.0) ** invGamma) * 255).astype("uint8")
+
+
+def adjust_gamma(image, gamma=1.5):
+    return cv2.LUT(image, get_gamma_table(gamma))
+
 
-    return cv2.LUT(image, table)
+@lru_cache(maxsize=None)
+def get_tile_lut(gamma=1.5):
+    """
+    Parameters:
+        gamma: Gamma correction applied to the square images.
+
+    Description:
+        Returns a 256-entry uint8 -> float32 lookup table which applies the gamma
+        correction followed by the Xception preprocessing (scaling to [-1, 1]).
+        Indexing a uint8 image with it replaces adjust_gamma and preprocess_input.
+
+    """
+    table = get_gamma_table(gamma).astype(np.float32)
+    return table / np.float32(127.5) - np.float32(1.0)
 
 
 def get_pred(preds, labels):
@@ -23,6 +42,34 @@ def get_pred(preds, labels):
     return labels[index_of_max]
 
 
+def get_square_values(preds, labels):
+    """
+    Parameters:
+        preds: (N, CLASSES) array of CNN predictions, one row per square.
+        labels: Labels corresponding to the prediction columns.
+
+    Description:
+        Converts a batch of square predictions into board array values where a White
+        piece is 1, a Black piece is 0 and an empty square is -1.
+
+    """
+    values = np.array([LABEL_VALUES[label] for label in labels])
+    return values[np.argmax(preds, axis=1)].astype(float)
+
+
+def get_board_arr(preds, labels):
+    """
+    Parameters:
+        preds: (64, CLASSES) array of CNN predictions, one row per square in row-order.
+        labels: Labels corresponding to the prediction columns.
+
+    Description:
+        Converts the predictions for all 64 squares into an 8x8 board array.
+
+    """
+    return get_square_values(preds, labels).reshape((8, 8))
+
+
 def show_img(img):
     img = cv2.resize(img, (700, 700))
     cv2.imshow("Image", img)
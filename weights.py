@@ -0,0 +1,194 @@
+import argparse
+import json
+import os
+from functools import lru_cache
+import numpy as np
+from config import *
+
+ALIGNMENT = 64
+
+
+def load_source_model(name):
+    """
+    Description:
+        Loads the original Keras model of the given name ("square" or "laps") from its own files.
+
+    """
+    if name == "square":
+        from keras.models import load_model
+        return load_model(MODEL_LOC)
+
+    from keras.models import model_from_json
+    model = model_from_json(open(LAPS_MODEL_LOC, "r").read())
+    model.load_weights(LAPS_WEIGHTS_LOC)
+    return model
+
+
+def get_index_loc(store_loc):
+    return os.path.splitext(store_loc)[0] + ".json"
+
+
+def to_onnx(model):
+    """
+    Description:
+        Converts a Keras model to an ONNX ModelProto with a dynamic batch dimension.
+
+    """
+    import tensorflow as tf
+    import tf2onnx
+
+    spec = (tf.TensorSpec((None,) + tuple(model.input_shape[1:]), tf.float32, name="input"),)
+    model_proto, _ = tf2onnx.convert.from_keras(model, input_signature=spec)
+    return model_proto
+
+
+def pack_weights(names, store_loc=WEIGHT_STORE_LOC, onnx=True):
+    """
+    Parameters:
+        names: Models to pack, "square" and/or "laps".
+        store_loc: Location of the packed weights. The index is written next to it as JSON.
+        onnx: Convert the models to ONNX, so that ONNX Runtime can run them directly on the mapped
+              weights. Otherwise the Keras weights and architecture are stored, and every process
+              that loads them gets its own copy, so the Keras fallback does not share memory.
+
+    Description:
+        Packs the weights of all the models into a single file, each tensor aligned to ALIGNMENT
+        bytes. When converted to ONNX, the initializers of every graph are moved into the store and
+        the graph is saved without them next to the store, with its tensors pointing into it.
+
+    """
+    index, offset = {}, 0
+
+    with open(store_loc, "wb") as file:
+        for name in names:
+            model = load_source_model(name)
+            entry = {"tensors": []}
+
+            if onnx:
+                from onnx import numpy_helper, save_model, TensorProto
+
+                model_proto = to_onnx(model)
+                tensors = []
+
+                for initializer in model_proto.graph.initializer:
+                    tensors.append((initializer.name, numpy_helper.to_array(initializer)))
+
+                entry["format"], entry["graph"] = "onnx", os.path.splitext(store_loc)[0] + "." + name + ".onnx"
+            else:
+                # weight.name is not unique in Keras 3 (every Dense has a "kernel"), the index keeps
+                # the keys unique and the weights are restored in this order
+                tensors = [("%d/%s" % (i, getattr(weight, "path", weight.name)), array)
+                           for i, (weight, array) in enumerate(zip(model.weights, model.get_weights()))]
+                entry["format"], entry["keras"] = "keras", model.to_json()
+
+            for tensor_name, array in tensors:
+                array = np.ascontiguousarray(array)
+                offset += -offset % ALIGNMENT
+                file.seek(offset)
+                file.write(array.tobytes())
+
+                entry["tensors"].append({"name": tensor_name, "dtype": str(array.dtype),
+                                         "shape": list(array.shape), "offset": offset})
+                offset += array.nbytes
+
+            if onnx:
+                for initializer, tensor in zip(model_proto.graph.initializer, entry["tensors"]):
+                    nbytes = int(np.prod(tensor["shape"])) * np.dtype(tensor["dtype"]).itemsize
+                    initializer.ClearField("raw_data")
+                    initializer.data_location = TensorProto.EXTERNAL
+                    del initializer.external_data[:]
+                    for key, value in [("location", os.path.basename(store_loc)),
+                                       ("offset", tensor["offset"]), ("length", nbytes)]:
+                        entry_proto = initializer.external_data.add()
+                        entry_proto.key, entry_proto.value = key, str(value)
+
+                save_model(model_proto, entry["graph"])
+
+            index[name] = entry
+            print("Packed", name, "with", len(tensors), "tensors")
+
+    with open(get_index_loc(store_loc), "w") as file:
+        json.dump(index, file)
+
+    print("Saved", offset, "bytes of weights to", store_loc)
+
+
+class WeightStore:
+
+    def __init__(self, store_loc=WEIGHT_STORE_LOC):
+        """
+        store_loc: Location of weights packed with pack_weights.
+
+        Maps the packed weights read-only. Every process that maps the same file shares its pages
+        through the page cache, so the weights are only resident once however many workers use them.
+        """
+        with open(get_index_loc(store_loc), "r") as file:
+            self.index = json.load(file)
+
+        self.buffer = np.memmap(store_loc, dtype=np.uint8, mode="r")
+
+
+    def get_tensors(self, name):
+        """
+        Description:
+            Returns the tensors of the given model as a dictionary of read-only views into the
+            mapped file. Nothing is read from disk until the views are used.
+
+        """
+        tensors = {}
+
+        for tensor in self.index[name]["tensors"]:
+            dtype = np.dtype(tensor["dtype"])
+            nbytes = int(np.prod(tensor["shape"])) * dtype.itemsize
+            view = self.buffer[tensor["offset"]: tensor["offset"] + nbytes]
+            tensors[tensor["name"]] = view.view(dtype).reshape(tensor["shape"])
+
+        return tensors
+
+
+@lru_cache(maxsize=None)
+def get_weight_store(store_loc=WEIGHT_STORE_LOC):
+    return WeightStore(store_loc)
+
+
+def load_shared_model(name, store_loc=WEIGHT_STORE_LOC):
+    """
+    Parameters:
+        name: Model in the store, "square" or "laps".
+        store_loc: Location of the packed weights.
+
+    Description:
+        Builds the model on top of the mapped weights. ONNX models are run by ONNX Runtime directly
+        on the mapped buffers. Keras cannot use external buffers, so Keras models are given a copy
+        of the weights, which only saves the deserialization of the original files and does not
+        share memory between the processes.
+
+    Returns:
+        A model with a Keras style predict method.
+
+    """
+    store = get_weight_store(store_loc)
+    entry = store.index[name]
+
+    if entry["format"] == "onnx":
+        from inference import ONNXModel
+        return ONNXModel(entry["graph"], THREAD_BUDGET["tensorflow_intra"], initializers=store.get_tensors(name))
+
+    from inference import import_keras
+    model = import_keras().models.model_from_json(entry["keras"])
+    model.set_weights(list(store.get_tensors(name).values()))
+    return model
+
+
+if __name__ == "__main__":
+    p = argparse.ArgumentParser(description='Pack the model weights into a shared, memory-mapped store.')
+
+    p.add_argument('--models', type=str, nargs='+', default=['square', 'laps'],
+                   help='models to pack (default: square laps)')
+    p.add_argument('--output', type=str, default=WEIGHT_STORE_LOC,
+                   help='location of the packed weights (default: WEIGHT_STORE_LOC)')
+    p.add_argument('--keras', action='store_true',
+                   help='store the Keras weights instead of converting the models to ONNX')
+
+    args = p.parse_args()
+    pack_weights(args.models, args.output, onnx=not args.keras)
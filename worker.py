@@ -0,0 +1,189 @@
+import multiprocessing
+import queue
+import sys
+import numpy as np
+from multiprocessing import shared_memory
+from utils import *
+
+
+def run_worker(shm_name, frame_shape, slots, requests, results):
+    """
+    Description:
+        Entry point of the perception process. Frames are read straight from the shared memory
+        slots named in the requests, so they are never pickled or copied between the processes.
+        Only the small results are sent back through the results queue.
+
+    """
+    from threads import configure_threads
+    configure_threads(role="worker", tensorflow=True)
+
+    from models import ModelManager
+    from perception import PerceptionLayer
+
+    shm = shared_memory.SharedMemory(name=shm_name)
+    frames = np.ndarray((slots,) + tuple(frame_shape), dtype=np.uint8, buffer=shm.buf)
+    models = ModelManager()
+    percept = PerceptionLayer(models, cascade=True, show=False, calibration_loc=CALIBRATION_LOC)
+
+    while True:
+        request = requests.get()
+        op, slot_ids = request[0], request[1]
+
+        if op == "stop":
+            break
+
+        try:
+            if op == "read":
+                result = percept.generate_board_probs_frames([frames[i] for i in slot_ids])
+            elif op == "verify":
+                result = percept.verify_squares([frames[i] for i in slot_ids], request[2])
+            elif op == "calibrate":
+                result = percept.calibrate_empty(percept.tiles, request[2])
+            elif op == "calibrate_board":
+                result = percept.calibrate_board(frames[slot_ids[0]])
+            elif op == "swap":
+                result = models.swap(on_swap=percept.reset_incremental)
+            else:
+                raise ValueError("Unknown perception request: " + str(op))
+
+            results.put((op, slot_ids, result, None))
+
+        except Exception as e:
+            results.put((op, slot_ids, None, str(e)))
+
+    del frames
+    shm.close()
+
+
+class PerceptionWorker:
+
+    def __init__(self, frame_shape, slots=WORKER_SLOTS):
+        """
+        frame_shape: Shape of the camera frames, e.g. (480, 640, 3).
+        slots: Number of frames in the shared memory ring.
+
+        Runs the PerceptionLayer in a separate process so that board detection and CNN inference
+        never block the camera preview, the UI or the serial link. The camera writes frames
+        directly into a ring of shared memory slots, and requests only name the slots to read.
+        """
+        size = int(np.prod(frame_shape)) * slots
+        self.__shm = shared_memory.SharedMemory(create=True, size=size)
+        self.frames = np.ndarray((slots,) + tuple(frame_shape), dtype=np.uint8, buffer=self.__shm.buf)
+        self.__free = list(range(slots))
+        self.__next = None
+        self.__requests = multiprocessing.Queue()
+        self.__results = multiprocessing.Queue()
+        self.__process = multiprocessing.Process(
+            target=run_worker, args=(self.__shm.name, frame_shape, slots, self.__requests, self.__results),
+            daemon=True)
+        self.__process.start()
+
+
+    def capture(self, cam):
+        """
+        Parameters:
+            cam: cv2.VideoCapture the frame is read from.
+
+        Description:
+            Reads the next camera frame directly into a free shared memory slot. The same slot is
+            reused by the next capture unless it has been submitted in the meantime.
+
+        Returns:
+            The slot index and the frame, which is a view of the shared memory.
+
+        """
+        if self.__next is None:
+            if len(self.__free) == 0:
+                raise RuntimeError("No free frame slots, the perception process is falling behind")
+            self.__next = self.__free.pop(0)
+
+        view = self.frames[self.__next]
+        ret, frame = cam.read(view)
+
+        # OpenCV allocates a new array when the frame does not fit the slot
+        if ret and frame.ctypes.data != view.ctypes.data:
+            view[...] = frame
+
+        return self.__next, view
+
+
+    def drain(self, cam, n=CAMERA_BUFFER):
+        """
+        Description:
+            Grabs and drops the n frames cv2.VideoCapture may have buffered, so that the next capture
+            shows the scene as it is now and not from before e.g. a move of the robot.
+
+        """
+        for _ in range(n):
+            cam.grab()
+
+
+    def capture_frames(self, cam, n):
+        """
+        Description:
+            Reads n consecutive camera frames into separate slots and returns the slot indexes,
+            which should be submitted together, e.g. for a multi-frame read.
+
+        """
+        slot_ids = []
+
+        for _ in range(n):
+            slot, frame = self.capture(cam)
+            slot_ids.append(slot)
+            self.__next = None
+
+        return slot_ids
+
+
+    def submit(self, op, slot_ids=(), *args):
+        """
+        Parameters:
+            op: "read", "verify", "calibrate", "calibrate_board" or "swap".
+            slot_ids: Slots holding the frames of the request. They are not reused by capture
+                      until the result of the request has been received.
+
+        """
+        for slot in slot_ids:
+            if slot == self.__next:
+                self.__next = None
+
+        self.__requests.put((op, tuple(slot_ids)) + args)
+
+
+    def poll(self, block=False):
+        """
+        Description:
+            Returns the next available result as an (op, result) tuple, or None if no result is
+            ready. The slots of the request are released.
+
+        """
+        try:
+            op, slot_ids, result, error = self.__results.get(block=block)
+        except queue.Empty:
+            return None
+
+        self.__free.extend(slot_ids)
+
+        if error is not None:
+            sys.stderr.write("Perception " + op + " failed: " + error + "\n")
+
+        return op, result
+
+
+    def wait(self, op):
+        """
+        Description:
+            Blocks until the result of the given operation is received and returns it.
+
+        """
+        while True:
+            done, result = self.poll(block=True)
+            if done == op:
+                return result
+
+
+    def close(self):
+        self.__requests.put(("stop", ()))
+        self.__process.join(timeout=5)
+        self.__shm.close()
+        self.__shm.unlink()